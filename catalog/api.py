@@ -0,0 +1,90 @@
+"""Read-only JSON API over the catalog's enrollment data.
+
+Small responses are sent whole. Responses that grow with the catalog,
+like everything in a term, are streamed: rows are read from the
+database in chunks and written out as they're read."""
+
+from django.http import JsonResponse, StreamingHttpResponse
+from catalog.models import *
+from catalog.generation import cacheByGeneration
+from catalog.stats import STATS_FIELDS, enrollmentByTerm
+from catalog.streaming import keysetChunks, streamJsonList
+
+import json
+
+def notFound(message):
+    return JsonResponse({'error': message}, status=404)
+
+def streamJson(prefix, items, suffix):
+    return StreamingHttpResponse(streamJsonList(prefix, items, suffix), content_type='application/json')
+
+@cacheByGeneration
+def courseEnrollment(request, subject, code):
+    """Enrollment in each term from the first to the last one the course was
+    offered in, per section type. The same series the course page charts."""
+
+    course = Course.objects.filter(subject_id=subject.upper(), code=code.upper()).first()
+    if course == None:
+        return notFound("Course '" + subject + " " + code + "' not found.")
+
+    return JsonResponse({
+        'subject': course.subject_id,
+        'code': course.code,
+        'name': course.name,
+        'terms': [{
+            'code': term.code,
+            'name': term.name,
+            'offered': offered,
+            'sections': sections,
+        } for term, offered, sections in enrollmentByTerm(course)],
+    })
+
+@cacheByGeneration
+def termEnrollment(request, termCode):
+    """Enrollment of every course offered in a term, one row per
+    course and section type. Streamed."""
+
+    if not Term.objects.filter(code=termCode).exists():
+        return notFound("Term '" + termCode + "' not found.")
+
+    fields = ['id', 'course__subject_id', 'course__code', 'sectionType'] + STATS_FIELDS
+    rows = (dict(zip(['subject', 'code'] + fields[3:], row[1:]))
+        for row in keysetChunks(CourseTermStats.objects.filter(term_id=termCode), fields))
+
+    return streamJson('{"term": ' + json.dumps(termCode) + ', "enrollment": [', rows, ']}')
+
+@cacheByGeneration
+def termClasses(request, termCode):
+    """Every class offered in a term, with its enrollment. Streamed."""
+
+    if not Term.objects.filter(code=termCode).exists():
+        return notFound("Term '" + termCode + "' not found.")
+
+    fields = ['id', 'courseOffering__course__subject_id', 'courseOffering__course__code', 'classNum',
+        'sectionName', 'topic', 'campus', 'enrollmentTotal', 'enrollmentCapacity']
+    names = ['subject', 'code', 'classNum', 'section', 'topic', 'campus', 'enrollmentTotal', 'enrollmentCapacity']
+    rows = (dict(zip(names, row[1:]))
+        for row in keysetChunks(ClassOffering.objects.filter(courseOffering__term_id=termCode), fields))
+
+    return streamJson('{"term": ' + json.dumps(termCode) + ', "classes": [', rows, ']}')
+
+@cacheByGeneration
+def instructorClasses(request, instructorId):
+    """Every class an instructor has taught, with its enrollment,
+    most recent term first. Streamed."""
+
+    instructor = Instructor.objects.filter(id=instructorId).first()
+    if instructor == None:
+        return notFound("Instructor " + str(instructorId) + " not found.")
+
+    names = ['term', 'subject', 'code', 'classNum', 'section', 'enrollmentTotal', 'enrollmentCapacity']
+    rows = (dict(zip(names, row)) for row in (ClassOffering.objects
+        .filter(classlocation__instructor__id=instructorId).distinct()
+        .order_by('-courseOffering__term_id', 'courseOffering__course__subject_id', 'courseOffering__course__code', 'sectionName')
+        .values_list('courseOffering__term_id', 'courseOffering__course__subject_id', 'courseOffering__course__code',
+            'classNum', 'sectionName', 'enrollmentTotal', 'enrollmentCapacity')
+        .iterator()))
+
+    prefix = '{"id": ' + json.dumps(instructor.id) + ', "firstName": ' + json.dumps(instructor.firstName) + \
+        ', "lastName": ' + json.dumps(instructor.lastName) + ', "classes": ['
+    return streamJson(prefix, rows, ']}')
@@ -0,0 +1,378 @@
+"""Parser for the schedule of classes pages served by
+classes.uwaterloo.ca (salook.pl).
+
+The parsing logic is written once, against a small interface for
+walking the document tree. There are two backends for that interface:
+BeautifulSoup, which is always available, and lxml, which builds
+the tree in C and is several times faster on big subjects. Both give
+exactly the same output; catalog/tests.py checks that over the pages
+saved in catalog/testdata, and `manage.py checkparser` over the local
+page cache."""
+
+from bs4 import BeautifulSoup, NavigableString
+
+import re
+
+try:
+    import lxml.etree
+    import lxml.html
+except ImportError:
+    lxml = None
+
+LAST_UPDATED = re.compile('last updated', re.IGNORECASE)
+
+# i.e. <meta charset="utf-8"> or <meta ... content="text/html; charset=iso-8859-1">
+DECLARED_CHARSET = re.compile(rb'<meta[^>]*charset\s*=\s*["\']?([\w-]+)', re.IGNORECASE)
+
+def decodePage(content):
+    """Text of a raw page, for both backends. Uses the charset the page
+    declares if it has one, or else UTF-8, falling back to Windows-1252.
+    Guessing the encoding from the bytes instead (as BeautifulSoup does
+    when given bytes) runs chardet over the whole page whenever it has
+    any non-ASCII text, which takes longer than parsing it."""
+    if isinstance(content, str):
+        return content
+
+    encodings = ['utf-8', 'windows-1252']
+    declared = DECLARED_CHARSET.search(content[:4096])
+    if declared != None:
+        encodings.insert(0, declared.group(1).decode('ascii'))
+
+    for encoding in encodings:
+        try:
+            return content.decode(encoding)
+        except (LookupError, UnicodeDecodeError):
+            pass
+
+    # Windows-1252 leaves a few bytes undefined; Latin-1 takes anything.
+    return content.decode('latin-1')
+
+class SoupTree:
+    """Tree interface over a BeautifulSoup document."""
+
+    def __init__(self, content):
+        self.root = BeautifulSoup(decodePage(content), 'html.parser')
+
+    def first(self, node, name):
+        """First descendant of node with the given tag name, or None."""
+        return node.find(name)
+
+    def cells(self, node):
+        """All td and th descendants of node, in document order."""
+        return node.find_all(['td', 'th'])
+
+    def rows(self, table):
+        """tr children of a table."""
+        return list(filter(lambda x: type(x) != NavigableString and x.name == 'tr', table.contents))
+
+    def string(self, node):
+        """A node's only string, as with BeautifulSoup's Tag.string."""
+        return node.string
+
+    def contents(self, node):
+        return node.contents
+
+    def attr(self, node, name, default):
+        return node.get(name, default)
+
+    def findString(self, pattern):
+        return self.root.find(string=pattern)
+
+class LxmlTree:
+    """Tree interface over an lxml document, matching what SoupTree
+    would return for the same page."""
+
+    def __init__(self, content):
+        try:
+            self.root = lxml.html.document_fromstring(decodePage(content))
+        except lxml.etree.ParserError:
+            # Nothing in the page at all.
+            self.root = None
+
+    def first(self, node, name):
+        if node is None:
+            return None
+        return next(node.iterdescendants(name), None)
+
+    def cells(self, node):
+        return list(node.iterdescendants('td', 'th'))
+
+    def rows(self, table):
+        return [child for child in table if child.tag == 'tr']
+
+    def contents(self, node):
+        """Children of a node, with text as plain strings, like Tag.contents."""
+        contents = []
+        if node.text:
+            contents.append(node.text)
+        for child in node:
+            if isinstance(child.tag, str):
+                contents.append(child)
+            elif child.text:
+                # Comments count as strings.
+                contents.append(child.text)
+            if child.tail:
+                contents.append(child.tail)
+        return contents
+
+    def string(self, node):
+        while True:
+            if len(node) == 0:
+                return node.text if node.text else None
+            if node.text or len(node) > 1 or node[0].tail:
+                return None
+
+            node = node[0]
+            if not isinstance(node.tag, str):
+                return node.text
+
+    def attr(self, node, name, default):
+        return node.get(name, default)
+
+    def texts(self, node):
+        """Every piece of text under a node, in document order."""
+        if node.text:
+            yield node.text
+        for child in node:
+            yield from self.texts(child)
+            if child.tail:
+                yield child.tail
+
+    def findString(self, pattern):
+        if self.root is None:
+            return None
+        return next((text for text in self.texts(self.root) if pattern.search(text)), None)
+
+BACKENDS = {
+    'soup': SoupTree,
+}
+
+if lxml != None:
+    BACKENDS['lxml'] = LxmlTree
+
+DEFAULT_BACKEND = 'lxml' if lxml != None else 'soup'
+
+def parseScheduleOfClasses(content, termCode, subject, academicLevel, backend=DEFAULT_BACKEND):
+    """Parses the raw content of a schedule of classes page into a
+    list of class dicts, in the format of the old v2 API."""
+    tree = BACKENDS[backend](content)
+
+    # Object to return.
+    classes = []
+
+    # Get last updated time, if the page shows one.
+    lastUpdated = ""
+    marker = tree.findString(LAST_UPDATED)
+    if marker != None:
+        lastUpdated = str(re.search('last updated\\W*(.*)', marker, re.IGNORECASE | re.DOTALL).group(1).strip())[:100]
+
+    # No results for query, as no table (i.e. term out of range)
+    table = tree.first(tree.root, 'table')
+    if (table == None):
+        print("No classes returned for query " + str(termCode) + subject)
+        return classes
+
+    # Get trs in first table we see (should be outer-level table)
+    rows = tree.rows(table)
+    i = 0
+    # Loop through results table
+    while i < len(rows):
+        tr = rows[i]
+        # Each Course has a rows associated with it with
+        # labels for subject, catalog, units and title.
+        # Look for this label row.
+        tds = tree.cells(tr)
+        if (len(tds) == 4
+            and tree.string(tds[0]) == "Subject"
+            and (tree.string(tds[1]) == "Catalog #" or tree.string(tds[1]) == "Catalog#")
+            and tree.string(tds[2]) == "Units"
+            and tree.string(tds[3]) == "Title"):
+
+            # Retrieve the labelled values in the next row.
+            i = i + 1
+            tr = rows[i]
+            tds = tree.cells(tr)
+
+
+            # Convert strings to unicode strings so they don't carry
+            # references to soup object, saving memory
+            assert(subject == tree.string(tds[0]).strip())
+            catalogNumber = str(tree.string(tds[1]).strip())
+            units         = str(tree.string(tds[2]).strip())
+            title         = str(tree.string(tds[3]).strip())
+
+            i = i + 1
+            tr = rows[i]
+
+            # Check for a note associated with the course.
+            note = None
+            b = tree.first(tr, 'b')
+            if b != None and tree.string(b) == "Notes:":
+                note = str(tree.contents(tree.first(tr, 'td'))[1].strip())
+
+                i = i + 1
+                tr = rows[i]
+
+            # This row should be the table of classes.
+            classTable = tree.first(tr, 'table')
+
+            classRows = tree.rows(classTable)
+
+            j = 0
+            while j < len(classRows):
+                classTr = classRows[j]
+
+                classTds = tree.cells(classTr)
+                strings = [tree.string(td) for td in classTds]
+                italic = tree.first(classTds[0], 'i')
+                italicString = tree.string(italic) if italic != None else None
+
+                # make sure that everything lines up with what we expect.
+                if j == 0:
+                    assert(len(classTds) == 13 and
+                        (strings[0] == "Class"
+                        and strings[1] == "Comp Sec"
+                        and strings[2] == "Camp Loc"
+                        and (strings[3] == "Assoc. Class" or strings[3] == "Assoc Class")
+                        and strings[4] == "Rel 1"
+                        and strings[5] == "Rel 2"
+                        and strings[6] == "Enrl Cap"
+                        and strings[7] == "Enrl Tot"
+                        and strings[8] == "Wait Cap"
+                        and strings[9] == "Wait Tot"
+                        and strings[10] == "Time Days/Date"
+                        and strings[11] == "Bldg Room"
+                        and strings[12] == "Instructor"))
+                elif italic != None and italicString.startswith("Reserve:"):
+                    # Check if this is a reserve.
+                    # If it is, add the reserve to the last class we saw.
+
+                    # Grab reserve group from stuff after colon.
+                    reserveGroup            = str(strings[0].split(':', 2)[1].strip())
+                    enrollmentCapacity      = str(strings[1].strip())  if strings[1] != None else None
+                    enrollmentTotal         = str(strings[2].strip())  if strings[2] != None else None
+
+                    classes[-1]["reserves"].append({
+                        "reserve_group": reserveGroup,
+                        "enrollment_capacity": enrollmentCapacity,
+                        "enrollment_total": enrollmentTotal,
+                    })
+
+                elif italic != None and italicString.startswith("Held With:"):
+                    # Check if the previous section was "Held With" another class.
+                    # Grab held_with group from stuff after colon.
+                    heldWith = str(strings[0].split(':', 2)[1].strip())
+
+                    classes[-1]["held_with"].append(heldWith)
+
+                elif italic != None and italicString.startswith("Topic:"):
+                    # Check if the previous section has a topic.
+                    topic = str(strings[0].split(':', 2)[1].strip())
+
+                    classes[-1]["topic"] = topic
+
+                elif len(strings[0].strip()) == 0:
+                    # Empty row; contains extra instructor, cancelled section, etc.
+                    ""
+                else:
+                    assert(len(classTds) == 12 or len(classTds) == 13)
+                    # Regular class entry.
+                    classNumber             = str(strings[0].strip())  if strings[0] != None else None
+                    section                 = str(strings[1].strip())  if strings[1] != None else None
+                    campus                  = str(strings[2].strip())  if strings[2] != None else None
+                    associatedClass         = str(strings[3].strip())  if strings[3] != None else None
+                    relatedComponent1       = str(strings[4].strip())  if strings[4] != None else None
+                    relatedComponent2       = str(strings[5].strip())  if strings[5] != None else None
+                    enrollmentCapacity      = str(strings[6].strip())  if strings[6] != None else None
+                    enrollmentTotal         = str(strings[7].strip())  if strings[7] != None else None
+                    waitingCapacity         = str(strings[8].strip())  if strings[8] != None else None
+                    waitingTotal            = str(strings[9].strip())  if strings[9] != None else None
+                    time                    = str(strings[10].strip()) if strings[10] != None else None
+
+                    buildingRoom            = str(strings[11].strip()) if strings[11] != None else None
+                    building                = buildingRoom.split(' ', 2)[0] if buildingRoom != None and len(buildingRoom) > 0 else None
+                    room                    = buildingRoom.split(' ', 2)[1] if buildingRoom != None and len(buildingRoom.split(' ')) > 1 else None
+
+                    # Instructors will be located in next step
+                    #instructor              = str(strings[12].strip() if len(classTds) > 12 and strings[12] != None else None)
+
+                    # TBA is held in the time section
+                    isTBA = False
+                    if time == "TBA":
+                        time = None
+                        isTBA = True
+
+
+                    classes.append({
+                        "subject": subject,
+                        "catalog_number": catalogNumber,
+                        "units": units,
+                        "title": title,
+                        "note": note,
+                        "class_number": classNumber,
+                        "section": section,
+                        "campus": campus,
+                        "associated_class": associatedClass,
+                        "related_component_1": relatedComponent1,
+                        "related_component_2": relatedComponent2,
+                        "enrollment_capacity": enrollmentCapacity,
+                        "enrollment_total": enrollmentTotal,
+                        "waiting_capacity": waitingCapacity,
+                        "waiting_total": waitingTotal,
+                        "topic": None,
+                        "reserves": [
+                            # Will be filled out in next rows.
+                        ],
+                        "classes": [
+                            {
+                                "date": {
+                                    "start_time": None,
+                                    "end_time": None,
+                                    "weekdays": time,
+                                    "start_date": None,
+                                    "end_date": None,
+                                    "is_tba": isTBA,
+                                    "is_cancelled": False,
+                                    "is_closed": False
+                                },
+                                "location": {
+                                    "building": building,
+                                    "room": room
+                                },
+                                "instructors": []
+                            }
+                        ],
+                        "held_with": [
+                            # Will be filled out in next rows.
+                        ],
+                        "term": termCode,
+                        "academic_level": academicLevel,
+                        "last_updated": lastUpdated
+                    })
+
+
+                    column = 0
+                    for td, string in zip(classTds, strings):
+
+                        # 12 is instructor column
+                        if column == 12:
+                            if len(string.strip()) > 0:
+                                classes[-1]["classes"][0]["instructors"].append(str(string.strip()))
+
+                        elif string != None:
+                            if string.strip() == "Cancelled Section":
+                                classes[-1]["classes"][0]["date"]["is_cancelled"] = True
+                            if string.strip() == "Closed Section":
+                                classes[-1]["classes"][0]["date"]["is_closed"] = True
+
+                        # Keep track of which column we're on.
+                        column = column + tree.attr(td, 'colspan', 1)
+
+                j = j + 1
+
+            i = i + 1
+            tr = rows[i]
+            assert(len(tree.contents(tree.first(tr, 'td'))) == 0)
+        i = i + 1
+
+    return classes
@@ -0,0 +1,132 @@
+"""Writing the catalog out to columnar files for analysis.
+
+Tables are written as Parquet if pyarrow is installed, or as gzipped
+CSV otherwise. Rows are read in chunks and each chunk is written out
+before the next is read, so memory use doesn't depend on table size."""
+
+from catalog.models import *
+from catalog.streaming import keysetChunks
+
+import csv
+import gzip
+import os
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Column types, by name, as they're given to each writer.
+INT = 'int'
+STR = 'str'
+BOOL = 'bool'
+DATETIME = 'datetime'
+
+# Tables that are written whole on every export:
+# (file name, function returning the queryset, [(field, type), ...])
+# The first field of each table is its primary key.
+CATALOG_TABLES = [
+    ('terms', lambda: Term.objects.all(),
+        [('code', STR), ('name', STR)]),
+    ('subjects', lambda: Subject.objects.all(),
+        [('code', STR), ('name', STR)]),
+    ('courses', lambda: Course.objects.all(),
+        [('id', INT), ('subject_id', STR), ('code', STR), ('name', STR)]),
+    ('instructors', lambda: Instructor.objects.all(),
+        [('id', INT), ('firstName', STR), ('lastName', STR)]),
+]
+
+# Tables partitioned by term: like above, but the function takes a term code.
+TERM_TABLES = [
+    ('course_offerings', lambda termCode: CourseOffering.objects.filter(term_id=termCode),
+        [('id', INT), ('course_id', INT), ('name', STR), ('units', STR)]),
+    ('class_offerings', lambda termCode: ClassOffering.objects.filter(courseOffering__term_id=termCode),
+        [('id', INT), ('courseOffering_id', INT), ('classNum', STR), ('sectionName', STR), ('topic', STR),
+        ('campus', STR), ('associatedClass', STR), ('relComp1', STR), ('relComp2', STR),
+        ('enrollmentCapacity', INT), ('enrollmentTotal', INT), ('waitingCapacity', INT), ('waitingTotal', INT)]),
+    ('class_locations', lambda termCode: ClassLocation.objects.filter(classOffering__courseOffering__term_id=termCode),
+        [('id', INT), ('classOffering_id', INT), ('startDate', STR), ('endDate', STR), ('startTime', STR),
+        ('endTime', STR), ('weekdays', STR), ('building', STR), ('room', STR),
+        ('isCancelled', BOOL), ('isClosed', BOOL), ('isTBA', BOOL)]),
+    ('class_reserves', lambda termCode: ClassReserve.objects.filter(classOffering__courseOffering__term_id=termCode),
+        [('id', INT), ('classOffering_id', INT), ('reserveGroup', STR),
+        ('enrollmentCapacity', INT), ('enrollmentTotal', INT)]),
+    ('enrollment_snapshots', lambda termCode: EnrollmentSnapshot.objects.filter(term_id=termCode),
+        [('id', INT), ('classOffering_id', INT), ('scraped', DATETIME), ('enrollmentCapacity', INT),
+        ('enrollmentTotal', INT), ('waitingCapacity', INT), ('waitingTotal', INT)]),
+    ('class_location_instructors', lambda termCode: ClassLocation.instructor.through.objects
+            .filter(classlocation__classOffering__courseOffering__term_id=termCode),
+        [('id', INT), ('classlocation_id', INT), ('instructor_id', INT)]),
+]
+
+FORMATS = ['csv']
+if pyarrow != None:
+    FORMATS.append('parquet')
+
+DEFAULT_FORMAT = 'parquet' if pyarrow != None else 'csv'
+
+class CsvWriter:
+    """Writes rows to a gzipped CSV file with a header row."""
+
+    extension = '.csv.gz'
+
+    def __init__(self, path, columns):
+        self.file = gzip.open(path, 'wt', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, kind in columns])
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+class ParquetWriter:
+    """Writes rows to a Parquet file, one row group per chunk."""
+
+    extension = '.parquet'
+
+    def __init__(self, path, columns):
+        types = { INT: pyarrow.int64(), STR: pyarrow.string(), BOOL: pyarrow.bool_(),
+            DATETIME: pyarrow.timestamp('us', tz='UTC') }
+        self.schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression='snappy')
+
+    def write(self, rows):
+        arrays = [pyarrow.array([row[i] for row in rows], type=field.type) for i, field in enumerate(self.schema)]
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+WRITERS = {
+    'csv': CsvWriter,
+    'parquet': ParquetWriter,
+}
+
+def exportTable(queryset, columns, path, format, chunkSize):
+    """Writes every row of a queryset to path (plus the format's extension),
+    chunkSize rows at a time. The file only appears once it's complete.
+    Returns the number of rows written."""
+    Writer = WRITERS[format]
+    path += Writer.extension
+    temporary = path + '.tmp'
+
+    writer = Writer(temporary, columns)
+    rows = 0
+    chunk = []
+    for row in keysetChunks(queryset, [name for name, kind in columns], chunkSize):
+        chunk.append(row)
+        if len(chunk) >= chunkSize:
+            writer.write(chunk)
+            rows += len(chunk)
+            chunk = []
+
+    if len(chunk) > 0:
+        writer.write(chunk)
+        rows += len(chunk)
+    writer.close()
+
+    os.replace(temporary, path)
+    return rows
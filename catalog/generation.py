@@ -0,0 +1,206 @@
+"""Caching of rendered pages, keyed on the data generation.
+
+Catalog pages only change when the scrapers write new data, so
+instead of expiring cached pages after some time, every cache key
+includes a generation number that the scrape commands bump once
+they're done. Pages cached under an old generation are just never
+read again, and get culled by the cache backend.
+
+The generation also serves as the pages' ETag, and the time it was
+bumped as their Last-Modified, so browsers and CDNs that already
+have a page get a 304 without any database work or rendering.
+
+Pages also change when the code or templates do, so keys and ETags
+include a code version as well: PAGE_CACHE_VERSION if it's set, or
+else a hash of the app's source and templates, so a deploy stops old
+renders from being served without anyone having to remember to.
+
+Works with any Django cache backend, including the local-memory
+and file-based ones."""
+
+from catalog.models import DataGeneration
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Last generation read from the database, and when, so that
+# every request doesn't have to go to the database for it.
+lastRead = { 'generation': None, 'updated': None, 'readAt': 0.0 }
+lastReadLock = threading.Lock()
+
+# How cached pages have been served since the last log line.
+hits = { 'requests': 0, 'notModified': 0, 'cached': 0 }
+hitsLock = threading.Lock()
+
+def readGeneration():
+    """The current data generation and when it was bumped (or None),
+    as of at most DATA_GENERATION_POLL seconds ago."""
+    now = time.monotonic()
+    with lastReadLock:
+        if lastRead['generation'] != None and now - lastRead['readAt'] < settings.DATA_GENERATION_POLL:
+            return lastRead['generation'], lastRead['updated']
+
+    generation, updated = DataGeneration.objects.values_list('generation', 'updated').first() or (0, None)
+
+    with lastReadLock:
+        lastRead['generation'] = generation
+        lastRead['updated'] = updated
+        lastRead['readAt'] = now
+    return generation, updated
+
+def currentGeneration():
+    return readGeneration()[0]
+
+def bumpGeneration():
+    """Marks everything cached so far as stale. Called by the
+    scrape commands once they've committed new data."""
+    if DataGeneration.objects.update(generation=F('generation') + 1, updated=timezone.now()) == 0:
+        DataGeneration.objects.create(generation=1, updated=timezone.now())
+
+    # This process doesn't need to wait for the next poll.
+    with lastReadLock:
+        lastRead['generation'] = None
+
+# Key -> (generation, value) for things worked out from the data
+# that are worth keeping in memory until the next scrape.
+derived = {}
+derivedLock = threading.Lock()
+
+def perGeneration(key, build):
+    """Returns build(), only calling it again once the generation changes."""
+    generation = currentGeneration()
+    with derivedLock:
+        entry = derived.get(key)
+        if entry != None and entry[0] == generation:
+            return entry[1]
+
+    value = build()
+    with derivedLock:
+        derived[key] = (generation, value)
+    return value
+
+# (version, newest source file's mtime), worked out once per process.
+sourceVersion = None
+
+def codeVersion():
+    """Version of the code rendering pages, and when that code was
+    last changed as a datetime."""
+    global sourceVersion
+    if sourceVersion != None:
+        return sourceVersion
+
+    # The catalog app (its code and any app templates) and the
+    # project-wide template directories.
+    roots = [Path(__file__).resolve().parent]
+    for template in settings.TEMPLATES:
+        roots += [Path(directory) for directory in template.get('DIRS', [])]
+
+    digest = hashlib.sha1()
+    newest = 0.0
+    for root in roots:
+        for path in sorted(root.rglob('*')):
+            if path.suffix in ('.py', '.html') and path.is_file():
+                digest.update(path.relative_to(root).as_posix().encode() + b'\0' + path.read_bytes())
+                newest = max(newest, path.stat().st_mtime)
+
+    version = settings.PAGE_CACHE_VERSION or digest.hexdigest()[:12]
+    sourceVersion = (version, datetime.fromtimestamp(newest, tz=timezone.utc))
+    return sourceVersion
+
+def etag(generation):
+    return '"' + codeVersion()[0] + '-' + str(generation) + '"'
+
+def lastModified(updated):
+    """When a page was last changed: the later of the last scrape and the last deploy."""
+    changed = codeVersion()[1]
+    return max(updated, changed) if updated != None else changed
+
+def pageKey(request, generation):
+    path = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+    return 'page:' + codeVersion()[0] + ':' + str(generation) + ':' + path
+
+def countHit(outcome=None):
+    """Tallies how a request was served, and every PAGE_HIT_LOG_EVERY
+    requests logs the share answered with a 304 or from the cache."""
+    with hitsLock:
+        hits['requests'] += 1
+        if outcome != None:
+            hits[outcome] += 1
+
+        if hits['requests'] < settings.PAGE_HIT_LOG_EVERY:
+            return
+
+        counts = dict(hits)
+        for name in hits:
+            hits[name] = 0
+
+    logger.info("Pages: %d requests, %.1f%% not modified, %.1f%% from cache",
+        counts['requests'],
+        100.0 * counts['notModified'] / counts['requests'],
+        100.0 * counts['cached'] / counts['requests'])
+
+def validators(response, generation, updated):
+    response['ETag'] = etag(generation)
+    response['Last-Modified'] = http_date(lastModified(updated).timestamp())
+
+    # Shared caches may keep the page, but should check back each time.
+    patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return response
+
+def cacheByGeneration(view):
+    """Caches successful GET responses of a view until the data
+    generation changes, and answers conditional requests for them
+    with a 304. Only for pages that look the same for every visitor."""
+
+    @wraps(view)
+    def cachedView(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+
+        generation, updated = readGeneration()
+
+        # The client already has this generation of the page.
+        notModified = get_conditional_response(request,
+            etag=etag(generation),
+            last_modified=int(lastModified(updated).timestamp()))
+        if notModified != None:
+            countHit('notModified')
+            return validators(notModified, generation, updated)
+
+        cache = caches[settings.PAGE_CACHE]
+        key = pageKey(request, generation)
+
+        cached = cache.get(key)
+        if cached != None:
+            countHit('cached')
+            content, contentType = cached
+            return validators(HttpResponse(content, content_type=contentType), generation, updated)
+
+        response = view(request, *args, **kwargs)
+
+        # Template responses (i.e. from generic views) render lazily.
+        if hasattr(response, 'render') and callable(response.render):
+            response = response.render()
+
+        countHit()
+        if response.status_code != 200 or response.streaming:
+            return response
+
+        cache.set(key, (response.content, response['Content-Type']), None)
+        return validators(response, generation, updated)
+
+    return cachedView
@@ -0,0 +1,104 @@
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from urllib3.util.retry import Retry
+
+import json
+import requests
+import threading
+import time
+
+class HostRateLimiter:
+    """Spaces out requests so that no single host sees more than
+    `rate` requests per second, no matter how many worker threads
+    are fetching at once."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.lock = threading.Lock()
+
+        # Host -> earliest time the next request may be sent.
+        self.nextSlot = {}
+
+    def wait(self, url):
+        if self.interval == 0:
+            return
+
+        host = urlparse(url).netloc
+
+        # Reserve a slot while holding the lock, but sleep outside
+        # of it so other hosts aren't held up.
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.nextSlot.get(host, now))
+            self.nextSlot[host] = slot + self.interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+class Page:
+    """Body of a fetched page. notModified is True when the server
+    said the page hadn't changed and the body came from the page cache."""
+
+    def __init__(self, content, notModified=False):
+        self.content = content
+        self.notModified = notModified
+
+    def json(self):
+        return json.loads(self.content)
+
+class HttpClient:
+    """HTTP client shared by the scrape commands.
+
+    Keeps connections alive in a pool, retries failed requests with
+    exponential backoff, and, when given a page cache key, revalidates
+    with If-None-Match/If-Modified-Since so unchanged pages come back
+    as 304s and are served from the page cache.
+
+    Safe to share between threads."""
+
+    def __init__(self, cache=None, rate=0, poolSize=10):
+        self.cache = cache
+        self.rateLimiter = HostRateLimiter(rate)
+        self.timeout = settings.SCRAPE_HTTP_TIMEOUT
+
+        retry = Retry(
+            total=settings.SCRAPE_HTTP_RETRIES,
+            backoff_factor=settings.SCRAPE_HTTP_BACKOFF,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+
+    def get(self, url, headers={}, cacheKey=None):
+        """Fetches a url and returns a Page. If cacheKey is given, the
+        response is kept in the page cache under that key and used to
+        make the request conditional next time."""
+        headers = dict(headers)
+
+        entry = self.cache.meta(cacheKey) if self.cache != None and cacheKey != None else None
+        if entry != None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('lastModified'):
+                headers['If-Modified-Since'] = entry['lastModified']
+
+        self.rateLimiter.wait(url)
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+
+        if response.status_code == 304 and entry != None:
+            return Page(self.cache.get(cacheKey), notModified=True)
+
+        response.raise_for_status()
+
+        if self.cache != None and cacheKey != None:
+            self.cache.put(cacheKey, response.content, url=url,
+                etag=response.headers.get('ETag'),
+                lastModified=response.headers.get('Last-Modified'))
+
+        return Page(response.content)
@@ -0,0 +1,416 @@
+from catalog.models import *
+from catalog.stats import refreshCourseTermStats
+from django.db import transaction
+from django.utils import timezone
+
+import hashlib
+import json
+
+# ClassOffering fields that come straight from the scraped page.
+CLASS_FIELDS = ['sectionName', 'topic', 'campus', 'associatedClass', 'relComp1', 'relComp2',
+    'enrollmentCapacity', 'enrollmentTotal', 'waitingCapacity', 'waitingTotal']
+
+# ClassOffering fields that are copied into an EnrollmentSnapshot when they change.
+ENROLLMENT_FIELDS = ['enrollmentCapacity', 'enrollmentTotal', 'waitingCapacity', 'waitingTotal']
+
+def intOrNone(value):
+    """Scraped numbers come in as strings; blank means no value."""
+    if value == None or str(value).strip() == '':
+        return None
+    return int(value)
+
+def classFields(c):
+    """Values for the scraped ClassOffering fields of a parsed class, as they would be stored."""
+    return {
+        'sectionName':        c.get('section'),
+        'topic':              c.get('topic'),
+        'campus':             c.get('campus'),
+        'associatedClass':    str(c.get('associated_class')),
+        'relComp1':           str(c.get('related_component_1')),
+        'relComp2':           str(c.get('related_component_2')),
+        'enrollmentCapacity': intOrNone(c.get('enrollment_capacity')),
+        'enrollmentTotal':    intOrNone(c.get('enrollment_total')),
+        'waitingCapacity':    intOrNone(c.get('waiting_capacity')),
+        'waitingTotal':       intOrNone(c.get('waiting_total')),
+    }
+
+def splitInstructor(instructor):
+    """Splits a 'Last,First' instructor string into (firstName, lastName)."""
+    fullName = instructor.split(',', 1)
+    return (fullName[1] if len(fullName) >= 2 else "", fullName[0])
+
+def reserveKey(reserve):
+    """Comparable value of a parsed reserve."""
+    return (reserve.get('reserve_group'),
+        intOrNone(reserve.get('enrollment_capacity')),
+        intOrNone(reserve.get('enrollment_total')))
+
+def locationKey(classLocation):
+    """Comparable value of a parsed class location, including its instructors."""
+    date = classLocation.get('date', {})
+    location = classLocation.get('location', {})
+    return (date.get('start_date'), date.get('end_date'), date.get('start_time'), date.get('end_time'),
+        date.get('weekdays'), location.get('building'), location.get('room'),
+        bool(date.get('is_cancelled')), bool(date.get('is_closed')), bool(date.get('is_tba')),
+        tuple(sorted(set(splitInstructor(i) for i in classLocation['instructors']))))
+
+def contentHash(c):
+    """Hash of everything we store about a parsed class, used to
+    tell whether it changed since the last scrape."""
+    content = [
+        classFields(c),
+        sorted(reserveKey(r) for r in c['reserves']),
+        sorted(locationKey(l) for l in c['classes']),
+    ]
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+class ClassLoader:
+    """Writes scraped classes to the database one page at a time.
+
+    A page is the list of class dicts returned for one term/subject
+    query. Rather than looking up and saving each object on its own,
+    foreign keys are resolved from in-memory maps and each table is
+    written with a handful of bulk queries inside one transaction."""
+
+    def __init__(self):
+        self.counts = { 'courses': 0, 'offerings': 0, 'instructors': 0,
+            'new': 0, 'updated': 0, 'unchanged': 0, 'snapshots': 0 }
+        self.reload()
+
+    def reload(self):
+        """(Re)reads the in-memory maps from the database. Needed after
+        a page fails to load, since its transaction was rolled back but
+        the maps may already have ids from it."""
+        # (subject code, catalog number) -> Course id
+        self.courses = {}
+        for courseId, subjectId, code in Course.objects.values_list('id', 'subject_id', 'code'):
+            self.courses[(subjectId, code)] = courseId
+
+        # term code -> { Course id -> CourseOffering id }.
+        # Loaded one term at a time as terms come up.
+        self.offerings = {}
+
+        # Identity map of every instructor, both ways:
+        # (firstName, lastName) -> Instructor id, and back.
+        self.instructors = {}
+        self.instructorNames = {}
+        for instructorId, firstName, lastName in Instructor.objects.values_list('id', 'firstName', 'lastName'):
+            self.addInstructor(instructorId, firstName, lastName)
+
+    def getOfferings(self, termCode):
+        if termCode not in self.offerings:
+            self.offerings[termCode] = dict(CourseOffering.objects
+                .filter(term_id=termCode)
+                .values_list('course_id', 'id'))
+        return self.offerings[termCode]
+
+    def loadPage(self, classes, termCode):
+        """Upserts a page of parsed classes for one term.
+        Returns the number of classes that were new or changed."""
+        if len(classes) == 0:
+            return 0
+
+        # If a class shows up more than once, the last copy wins.
+        classes = list(dict(((c['subject'], c['catalog_number'], c['class_number']), c) for c in classes).values())
+
+        with transaction.atomic():
+            self.resolveCourses(classes)
+            self.resolveOfferings(classes, termCode)
+            changed = self.upsertClasses(classes, termCode)
+            self.reconcileChildren(changed)
+
+            # Keep the course pages' enrollment totals in step.
+            if len(changed) > 0:
+                refreshCourseTermStats(termCode, set(self.courses[(c['subject'], c['catalog_number'])] for classId, c, isNew in changed))
+
+        return len(changed)
+
+    def resolveCourses(self, classes):
+        """Creates any courses on the page that aren't in the database yet."""
+        missing = {}
+        for c in classes:
+            key = (c['subject'], c['catalog_number'])
+            if key not in self.courses and key not in missing:
+                missing[key] = Course(subject_id=key[0], code=key[1], name=c['title'])
+
+        if len(missing) == 0:
+            return
+
+        Course.objects.bulk_create(missing.values(), ignore_conflicts=True)
+
+        # Bulk inserts don't give us back ids, so read them back.
+        for subjectId in set(key[0] for key in missing):
+            codes = [key[1] for key in missing if key[0] == subjectId]
+            for courseId, code in Course.objects.filter(subject_id=subjectId, code__in=codes).values_list('id', 'code'):
+                self.courses[(subjectId, code)] = courseId
+
+        self.counts['courses'] += len(missing)
+        print("    Added " + str(len(missing)) + " courses")
+
+    def resolveOfferings(self, classes, termCode):
+        """Creates any course offerings on the page that aren't in the database yet."""
+        offerings = self.getOfferings(termCode)
+
+        missing = set()
+        for c in classes:
+            courseId = self.courses[(c['subject'], c['catalog_number'])]
+            if courseId not in offerings:
+                missing.add(courseId)
+
+        if len(missing) == 0:
+            return
+
+        CourseOffering.objects.bulk_create(
+            [CourseOffering(term_id=termCode, course_id=courseId) for courseId in missing],
+            ignore_conflicts=True)
+
+        offerings.update(CourseOffering.objects
+            .filter(term_id=termCode, course_id__in=missing)
+            .values_list('course_id', 'id'))
+
+        self.counts['offerings'] += len(missing)
+        print("    Added " + str(len(missing)) + " course offerings")
+
+    def offeringId(self, classOffering, termCode):
+        courseId = self.courses[(classOffering['subject'], classOffering['catalog_number'])]
+        return self.offerings[termCode][courseId]
+
+    def upsertClasses(self, classes, termCode):
+        """Inserts new classes and updates the ones whose content changed,
+        and snapshots the enrollment of any whose numbers changed.
+        Returns a list of (ClassOffering id, parsed class, is new) for
+        every class that was inserted or updated; unchanged ones are left alone."""
+        offeringIds = set(self.offeringId(c, termCode) for c in classes)
+
+        existing = {}
+        for record in ClassOffering.objects.filter(courseOffering_id__in=offeringIds):
+            existing[(record.courseOffering_id, record.classNum)] = record
+
+        newRecords = []
+        updated = []
+        updatedFields = set()
+
+        # Parsed class for each key that needs its children reconciled.
+        pending = {}
+
+        # Key and fields of each class whose enrollment numbers changed, or is new.
+        snapshots = []
+
+        for c in classes:
+            key = (self.offeringId(c, termCode), c['class_number'])
+            digest = contentHash(c)
+            fields = classFields(c)
+
+            record = existing.get(key)
+            if record == None:
+                newRecords.append(ClassOffering(courseOffering_id=key[0], classNum=key[1], contentHash=digest, **fields))
+                pending[key] = (c, True)
+                snapshots.append((key, fields))
+            elif record.contentHash != digest:
+                if any(getattr(record, name) != fields[name] for name in ENROLLMENT_FIELDS):
+                    snapshots.append((key, fields))
+                for name, value in fields.items():
+                    if getattr(record, name) != value:
+                        setattr(record, name, value)
+                        updatedFields.add(name)
+                record.contentHash = digest
+                updated.append(record)
+                pending[key] = (c, False)
+            else:
+                self.counts['unchanged'] += 1
+
+        ClassOffering.objects.bulk_create(newRecords, ignore_conflicts=True)
+        if len(updated) > 0:
+            ClassOffering.objects.bulk_update(updated, sorted(updatedFields) + ['contentHash'])
+
+        self.counts['new'] += len(newRecords)
+        self.counts['updated'] += len(updated)
+        print("    " + str(len(newRecords)) + " new, " + str(len(updated)) + " updated, "
+            + str(len(classes) - len(newRecords) - len(updated)) + " unchanged classes")
+
+        if len(newRecords) == 0:
+            classIds = dict((key, record.id) for key, record in existing.items())
+        else:
+            # Bulk inserts don't give us back ids, so read the new ones back.
+            classIds = dict(((offeringId, classNum), classId) for classId, offeringId, classNum in ClassOffering.objects
+                .filter(courseOffering_id__in=offeringIds)
+                .values_list('id', 'courseOffering_id', 'classNum'))
+
+        self.snapshotEnrollment([(classIds[key], fields) for key, fields in snapshots], termCode)
+
+        return [(classIds[key], c, isNew) for key, (c, isNew) in pending.items()]
+
+    def snapshotEnrollment(self, classes, termCode):
+        """Adds an EnrollmentSnapshot with the numbers of each
+        (ClassOffering id, class fields) given, all stamped with the same time."""
+        if len(classes) == 0:
+            return
+
+        scraped = timezone.now()
+        EnrollmentSnapshot.objects.bulk_create([EnrollmentSnapshot(
+            classOffering_id = classId,
+            term_id          = termCode,
+            scraped          = scraped,
+            **dict((name, fields[name]) for name in ENROLLMENT_FIELDS),
+        ) for classId, fields in classes])
+
+        self.counts['snapshots'] += len(classes)
+
+    def resolveInstructors(self, classes):
+        """Returns a dictionary of (firstName, lastName) -> Instructor id
+        for every instructor named in the classes. Any that aren't in the
+        identity map yet are created together in one bulk insert."""
+        found = {}
+        missing = set()
+        for c in classes:
+            for classLocation in c['classes']:
+                for instructor in classLocation['instructors']:
+                    name = splitInstructor(instructor)
+                    if name in self.instructors:
+                        found[name] = self.instructors[name]
+                    else:
+                        missing.add(name)
+
+        if len(missing) > 0:
+            Instructor.objects.bulk_create(
+                [Instructor(firstName=name[0], lastName=name[1]) for name in missing],
+                ignore_conflicts=True)
+
+            # bulk_create doesn't give back ids on every backend, so read
+            # them.
+            for instructorId, firstName, lastName in (Instructor.objects
+                    .filter(firstName__in=set(name[0] for name in missing),
+                        lastName__in=set(name[1] for name in missing))
+                    .values_list('id', 'firstName', 'lastName')):
+                if (firstName, lastName) in missing:
+                    self.addInstructor(instructorId, firstName, lastName)
+
+            # The rest clashed with an instructor whose name the database
+            # collation counts as the same (i.e. MySQL ignores case and
+            # accents), so let the database find which one.
+            for name in missing:
+                if name not in self.instructors:
+                    self.instructors[name] = (Instructor.objects
+                        .filter(firstName=name[0], lastName=name[1])
+                        .values_list('id', flat=True).get())
+                found[name] = self.instructors[name]
+
+            self.counts['instructors'] += len(missing)
+            print("    Added " + str(len(missing)) + " instructors")
+
+        return found
+
+    def addInstructor(self, instructorId, firstName, lastName):
+        self.instructors[(firstName, lastName)] = instructorId
+        self.instructorNames[instructorId] = (firstName, lastName)
+
+    def reconcileChildren(self, changed):
+        """Brings the reserves, locations and location instructors of changed
+        classes in line with the page. Rows that match what's stored are kept;
+        only the ones that differ are deleted or inserted."""
+        if len(changed) == 0:
+            return
+
+        instructorIds = self.resolveInstructors([c for classId, c, isNew in changed])
+        Through = ClassLocation.instructor.through
+
+        # Load what's stored for classes that already existed.
+        storedIds = [classId for classId, c, isNew in changed if not isNew]
+
+        storedReserves = {}
+        for reserveId, classId, group, capacity, total in (ClassReserve.objects
+                .filter(classOffering_id__in=storedIds)
+                .values_list('id', 'classOffering_id', 'reserveGroup', 'enrollmentCapacity', 'enrollmentTotal')):
+            storedReserves.setdefault(classId, []).append((reserveId, (group, capacity, total)))
+
+        locationNames = {}
+        for locationId, instructorId in (Through.objects
+                .filter(classlocation__classOffering_id__in=storedIds)
+                .values_list('classlocation_id', 'instructor_id')):
+            locationNames.setdefault(locationId, []).append(self.instructorNames[instructorId])
+
+        storedLocations = {}
+        for row in (ClassLocation.objects
+                .filter(classOffering_id__in=storedIds)
+                .values_list('id', 'classOffering_id', 'startDate', 'endDate', 'startTime', 'endTime',
+                    'weekdays', 'building', 'room', 'isCancelled', 'isClosed', 'isTBA')):
+            key = row[2:] + (tuple(sorted(locationNames.get(row[0], []))),)
+            storedLocations.setdefault(row[1], []).append((row[0], key))
+
+        # Rows matching something on the page are kept; any that
+        # are left over afterwards are stale and get deleted.
+        def match(stored, wanted):
+            remaining = list(stored)
+            toInsert = []
+            for key in wanted:
+                for i in range(len(remaining)):
+                    if remaining[i][1] == key:
+                        del remaining[i]
+                        break
+                else:
+                    toInsert.append(key)
+            return toInsert, [rowId for rowId, key in remaining]
+
+        staleReserves = []
+        staleLocations = []
+        reserves = []
+        locations = []
+
+        for classId, c, isNew in changed:
+            newReserves, stale = match(storedReserves.get(classId, []), [reserveKey(r) for r in c['reserves']])
+            staleReserves += stale
+            for group, capacity, total in newReserves:
+                reserves.append(ClassReserve(
+                    classOffering_id   = classId,
+                    reserveGroup       = group,
+                    enrollmentCapacity = capacity,
+                    enrollmentTotal    = total,
+                ))
+
+            newLocations, stale = match(storedLocations.get(classId, []), [locationKey(l) for l in c['classes']])
+            staleLocations += stale
+            for key in newLocations:
+                locations.append((classId, key))
+
+        ClassReserve.objects.filter(id__in=staleReserves).delete()
+        ClassLocation.objects.filter(id__in=staleLocations).delete()
+
+        ClassReserve.objects.bulk_create(reserves)
+
+        if len(locations) == 0:
+            return
+
+        ClassLocation.objects.bulk_create([ClassLocation(
+            classOffering_id = classId,
+            startDate     = key[0],
+            endDate       = key[1],
+            startTime     = key[2],
+            endTime       = key[3],
+            weekdays      = key[4],
+            building      = key[5],
+            room          = key[6],
+            isCancelled   = key[7],
+            isClosed      = key[8],
+            isTBA         = key[9],
+        ) for classId, key in locations])
+
+        # Bulk inserts don't give us back ids. Everything for these classes
+        # that we didn't keep was just inserted, in order, inside this
+        # transaction, so reading them back by id lines them up with our list.
+        kept = set()
+        for stored in storedLocations.values():
+            kept.update(locationId for locationId, key in stored)
+        kept.difference_update(staleLocations)
+
+        locationIds = [locationId for locationId in (ClassLocation.objects
+            .filter(classOffering_id__in=set(classId for classId, key in locations))
+            .order_by('id')
+            .values_list('id', flat=True)) if locationId not in kept]
+        assert(len(locationIds) == len(locations))
+
+        links = []
+        for locationId, (classId, key) in zip(locationIds, locations):
+            for name in key[10]:
+                links.append(Through(classlocation_id=locationId, instructor_id=instructorIds[name]))
+
+        Through.objects.bulk_create(links, ignore_conflicts=True)
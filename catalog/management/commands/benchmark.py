@@ -0,0 +1,215 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from catalog.models import *
+from catalog.classparser import BACKENDS, parseScheduleOfClasses
+from catalog.loader import ClassLoader
+from catalog.synthetic import SyntheticCatalog
+
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import statistics
+import time
+
+# Term the loader benchmark writes to. Never committed.
+BENCHMARK_TERM = '9999'
+
+def percentile(values, share):
+    """Nearest-rank percentile, i.e. share=0.95 for p95."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+class Counter:
+    """Counts queries made while it's installed with execute_wrapper."""
+
+    def __init__(self):
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+def measure(run, repeat):
+    """Calls run() `repeat` times. Returns ([seconds per call], [queries per call])."""
+    times = []
+    queries = []
+    for _ in range(repeat):
+        counter = Counter()
+        with connection.execute_wrapper(counter):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        queries.append(counter.queries)
+    return times, queries
+
+class Command(BaseCommand):
+    help = "times the main catalog pages and the class loader, and compares them with a stored baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20,
+            help="Number of timed runs of each benchmark.")
+        parser.add_argument('--samples', type=int, default=10,
+            help="Number of different courses, subjects and instructors to request.")
+        parser.add_argument('--seed', type=int, default=0,
+            help="Seed for picking what to request, so runs are comparable.")
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json'),
+            help="JSON file of earlier results to compare with.")
+        parser.add_argument('--save-baseline', action='store_true',
+            help="Write these results to the baseline file instead of comparing.")
+        parser.add_argument('--tolerance', type=float, default=0.5,
+            help="How much slower than the baseline (as a share) p95 may get before it counts as a regression.")
+
+    def sampleUrls(self, rng, count):
+        """Benchmark name -> URLs to cycle through."""
+        def pick(values):
+            values = sorted(values)
+            return rng.sample(values, min(count, len(values)))
+
+        courses = pick(CourseOffering.objects.values_list('course__subject_id', 'course__code').distinct())
+        subjects = pick(Subject.objects.values_list('code', flat=True))
+        instructors = pick(ClassLocation.instructor.through.objects.values_list('instructor_id', flat=True).distinct())
+
+        if len(courses) == 0 or len(instructors) == 0:
+            raise CommandError("Nothing to benchmark; scrape or run seedcatalog first.")
+
+        return {
+            'courseDetail': [reverse('courseDetail', args=list(course)) for course in courses],
+            'subjectDetail': [reverse('subjectDetail', args=[subject]) for subject in subjects],
+            'instructorDetail': [reverse('instructorDetail', args=[instructorId]) for instructorId in instructors],
+            'courses': [reverse('courses')] + [reverse('courses') + '?q=' + subject for subject in subjects],
+        }
+
+    def benchmarkViews(self, urls, repeat):
+        client = Client()
+        results = {}
+        for name, paths in urls.items():
+            # One untimed pass, so one-off setup isn't counted.
+            for path in paths:
+                client.get(path)
+
+            requests = iter(paths * math.ceil(repeat / len(paths)))
+            def run():
+                response = client.get(next(requests))
+                if response.status_code != 200:
+                    raise CommandError(name + " returned " + str(response.status_code) + ".")
+            results[name] = measure(run, repeat)
+        return results
+
+    def benchmarkLoader(self, rng, repeat):
+        """Times loading a page of new classes, then loading the same page again
+        unchanged, into a throwaway term. Nothing is committed."""
+        catalog = SyntheticCatalog(years=1, subjects=20, courses=50, seed=rng.randint(0, 1000000))
+        pages = [catalog.page(catalog.terms[0][0], subject) for subject, name in catalog.subjects]
+        pages = [page for page in pages if len(page) > 0]
+
+        newTimes, newQueries, unchangedTimes, unchangedQueries = [], [], [], []
+        for i in range(repeat):
+            page = pages[i % len(pages)]
+            with transaction.atomic():
+                Term.objects.create(code=BENCHMARK_TERM, name='Benchmark')
+                Subject.objects.bulk_create([Subject(code=code, name=name) for code, name in catalog.subjects],
+                    ignore_conflicts=True)
+                loader = ClassLoader()
+
+                # The loader prints a line for every page.
+                with contextlib.redirect_stdout(io.StringIO()):
+                    times, queries = measure(lambda: loader.loadPage(page, BENCHMARK_TERM), 1)
+                    newTimes += times
+                    newQueries += queries
+
+                    times, queries = measure(lambda: loader.loadPage(page, BENCHMARK_TERM), 1)
+                    unchangedTimes += times
+                    unchangedQueries += queries
+
+                transaction.set_rollback(True)
+
+        return {
+            'loader (new page)': (newTimes, newQueries),
+            'loader (unchanged page)': (unchangedTimes, unchangedQueries),
+        }
+
+    def benchmarkParser(self, rng, repeat):
+        """Times each parser backend on one page of about 450 classes,
+        with accented names and no declared charset like the real pages."""
+        catalog = SyntheticCatalog(years=1, subjects=1, courses=100, offered=1.0, seed=rng.randint(0, 1000000))
+        termCode = catalog.terms[0][0]
+        subject = catalog.subjects[0][0]
+        classes = catalog.page(termCode, subject)
+        for c in classes:
+            for meeting in c['classes']:
+                meeting['instructors'] = [name.replace('e', 'é').replace('an', 'än').replace('o', 'ø')
+                    for name in meeting['instructors']]
+        content = catalog.html(classes)
+
+        results = {}
+        for backend in sorted(BACKENDS):
+            def run():
+                # The parser prints about empty pages.
+                with contextlib.redirect_stdout(io.StringIO()):
+                    parseScheduleOfClasses(content, termCode, subject, 'undergraduate', backend=backend)
+            results['parser (' + backend + ', non-ASCII)'] = measure(run, repeat)
+        return results
+
+    def handle(self, *args, **kwargs):
+        repeat = max(1, kwargs['repeat'])
+        rng = random.Random(kwargs['seed'])
+
+        print("Benchmarking against " + str(Course.objects.count()) + " courses and "
+            + str(ClassOffering.objects.count()) + " classes, " + str(repeat) + " runs each.")
+
+        # Skip the page cache so every request renders the page. The test
+        # client's requests come from 'testserver', which has to be allowed.
+        with override_settings(CACHES={ 'default': { 'BACKEND': 'django.core.cache.backends.dummy.DummyCache' } },
+                PAGE_CACHE='default', METRICS_SAMPLE_RATE=0, ALLOWED_HOSTS=['testserver']):
+            measured = self.benchmarkViews(self.sampleUrls(rng, kwargs['samples']), repeat)
+        measured.update(self.benchmarkLoader(rng, repeat))
+        measured.update(self.benchmarkParser(rng, repeat))
+
+        results = {}
+        for name, (times, queries) in measured.items():
+            results[name] = {
+                'p50': round(percentile(times, 0.5) * 1000, 2),
+                'p95': round(percentile(times, 0.95) * 1000, 2),
+                'queries': statistics.median(queries),
+            }
+
+        baselinePath = kwargs['baseline']
+        if kwargs['save_baseline']:
+            os.makedirs(os.path.dirname(baselinePath) or '.', exist_ok=True)
+            with open(baselinePath, 'w') as f:
+                json.dump(results, f, indent=4, sort_keys=True)
+
+        baseline = {}
+        if not kwargs['save_baseline'] and os.path.exists(baselinePath):
+            with open(baselinePath) as f:
+                baseline = json.load(f)
+
+        regressions = []
+        print("{:<30}{:>10}{:>10}{:>9}   {}".format("", "p50 ms", "p95 ms", "queries", "vs. baseline" if baseline else ""))
+        for name, result in results.items():
+            line = "{:<30}{:>10.2f}{:>10.2f}{:>9g}".format(name, result['p50'], result['p95'], result['queries'])
+
+            before = baseline.get(name)
+            if before != None:
+                change = (result['p95'] - before['p95']) / before['p95'] if before['p95'] > 0 else 0
+                line += "   p95 " + format(change * 100, '+.0f') + "%, queries " + format(result['queries'] - before['queries'], '+g')
+
+                if change > kwargs['tolerance'] or result['queries'] > before['queries']:
+                    regressions.append(name)
+                    line += "   REGRESSION"
+            print(line)
+
+        if kwargs['save_baseline']:
+            print("Saved baseline to " + baselinePath + ".")
+        elif len(baseline) == 0:
+            print("No baseline at " + baselinePath + "; run with --save-baseline to make one.")
+
+        if len(regressions) > 0:
+            raise CommandError("Slower or more queries than the baseline: " + ", ".join(regressions) + ".")
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from catalog.pagecache import PageCache
+from catalog.classparser import BACKENDS, parseScheduleOfClasses
+
+import contextlib
+import io
+import time
+
+class Command(BaseCommand):
+    help = "checks that every parser backend gives the same classes for each cached page, and times them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='classes',
+            help="Only check cached pages whose key starts with this (i.e. classes/1209/CS).")
+        parser.add_argument('--repeat', type=int, default=1,
+            help="Number of times to parse each page with each backend, for steadier timings.")
+
+    def handle(self, *args, **kwargs):
+        cache = PageCache()
+        keys = cache.keys(kwargs['prefix'])
+        backends = sorted(BACKENDS)
+
+        if len(keys) == 0:
+            raise CommandError("No cached pages found under '" + kwargs['prefix'] + "'; run scrapeclasses first.")
+
+        if len(backends) < 2:
+            print("Only the " + backends[0] + " backend is installed; timing it alone.")
+
+        # Total seconds spent in each backend
+        timings = dict((backend, 0.0) for backend in backends)
+        mismatches = []
+
+        for key in keys:
+            _, termCode, subject, academicLevel = key.split('/')
+            content = cache.get(key)
+
+            results = {}
+            for backend in backends:
+                start = time.perf_counter()
+                for _ in range(max(1, kwargs['repeat'])):
+                    # The parser prints about empty pages; keep that quiet.
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        try:
+                            results[backend] = parseScheduleOfClasses(content, termCode, subject, academicLevel, backend=backend)
+                        except Exception as e:
+                            # Both backends should fail the same way, too.
+                            results[backend] = repr(e)
+                timings[backend] += time.perf_counter() - start
+
+            if any(results[backend] != results[backends[0]] for backend in backends):
+                print("MISMATCH: " + key)
+                mismatches.append(key)
+
+        print("Checked " + str(len(keys)) + " pages.")
+        for backend in backends:
+            perPage = timings[backend] / len(keys) / max(1, kwargs['repeat'])
+            print("    " + backend + ": " + format(perPage * 1000, '.2f') + " ms/page"
+                + (" (" + format(timings['soup'] / timings[backend], '.1f') + "x soup)" if backend != 'soup' and timings[backend] > 0 else ""))
+
+        if len(mismatches) > 0:
+            raise CommandError(str(len(mismatches)) + " pages parsed differently between backends.")
+
+        print("All backends agree.")
@@ -0,0 +1,181 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from catalog.models import *
+from urllib.parse import urlencode
+
+import re
+
+# Tables small enough that reading them whole is fine.
+SMALL_TABLES = ['catalog_subject', 'catalog_term', 'catalog_datageneration', 'catalog_sitestats']
+
+def sampleUrls():
+    """(name, url) of each catalog page and API endpoint, filled
+    in with the most recently offered course and its subject, term
+    and one of its instructors."""
+    offering = CourseOffering.objects.select_related('course').order_by('-term_id', '-id').first()
+    if offering == None:
+        raise CommandError("No course offerings in the database; scrape or seed some data first.")
+
+    course = offering.course
+    termCode = offering.term_id
+    instructorId = (ClassLocation.instructor.through.objects
+        .filter(classlocation__classOffering__courseOffering=offering)
+        .values_list('instructor_id', flat=True).first())
+
+    # Filter by subject and number plus a word of the name, so
+    # the sample goes through every way a course can match.
+    courseQuery = course.subject_id + course.code + (' ' + course.name.split()[0] if course.name else '')
+
+    urls = [
+        ('homepage', reverse('homepage')),
+        ('statspage', reverse('statspage')),
+        ('subjects', reverse('subjects')),
+        ('courses', reverse('courses')),
+        ('courses (filtered)', reverse('courses') + '?' + urlencode({ 'q': courseQuery })),
+        ('courses (next page)', reverse('courses') + '?afterSubject=' + course.subject_id + '&afterCode=' + course.code),
+        ('subjectDetail', reverse('subjectDetail', args=[course.subject_id])),
+        ('courseDetail', reverse('courseDetail', args=[course.subject_id, course.code])),
+        ('courseRandom', reverse('courseRandom') + '?term=' + termCode),
+        ('instructors', reverse('instructors')),
+        ('instructorRandom', reverse('instructorRandom')),
+        ('typeahead', reverse('typeahead') + '?' + urlencode({ 'q': courseQuery })),
+        ('search', reverse('search') + '?q=' + course.subject_id),
+        ('apiCourseEnrollment', reverse('apiCourseEnrollment', args=[course.subject_id, course.code])),
+        ('apiTermEnrollment', reverse('apiTermEnrollment', args=[termCode])),
+        ('apiTermClasses', reverse('apiTermClasses', args=[termCode])),
+    ]
+    if instructorId != None:
+        urls += [
+            ('instructorDetail', reverse('instructorDetail', args=[instructorId])),
+            ('apiInstructorClasses', reverse('apiInstructorClasses', args=[instructorId])),
+        ]
+    return urls
+
+def explainMysql(cursor, sql, params):
+    """Plan rows as strings, the tables each reads in full, and
+    the tables whose whole index it walks."""
+    cursor.execute('EXPLAIN ' + sql, params)
+    columns = [column[0] for column in cursor.description]
+    plan = []
+    scans = []
+    walks = []
+    for row in cursor.fetchall():
+        row = dict(zip(columns, row))
+        plan.append(str(row.get('table')) + ': ' + str(row.get('type')) + ', key ' + str(row.get('key'))
+            + ', ~' + str(row.get('rows')) + ' rows' + (', ' + row['Extra'] if row.get('Extra') else ''))
+        # 'ALL' reads the table; 'index' walks a whole index in order.
+        if row.get('type') == 'ALL':
+            scans.append(str(row.get('table')))
+        elif row.get('type') == 'index':
+            walks.append(str(row.get('table')))
+    return plan, scans, walks
+
+def explainSqlite(cursor, sql, params):
+    """Plan rows as strings, the tables each reads in full, and
+    the tables whose whole index it walks."""
+    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+    plan = []
+    scans = []
+    walks = []
+    for row in cursor.fetchall():
+        detail = row[-1]
+        plan.append(detail)
+
+        # i.e. 'SCAN catalog_course' reads the table, while 'SEARCH ...' looks
+        # rows up by key. 'SCAN catalog_course USING INDEX ...' walks an index
+        # in order.
+        match = re.match(r'SCAN (TABLE )?(\w+)(.*)$', detail)
+        if match != None:
+            (walks if 'INDEX' in match.group(3) else scans).append(match.group(2))
+    return plan, scans, walks
+
+def boundedWalk(sql, params):
+    """Whether walking an index in order stops early: the query has a
+    LIMIT, like the list pages reading one page at a time, and nothing
+    that has to look inside each value (i.e. a LIKE '%x%' from
+    icontains), which may walk most of the index to fill the page."""
+    if re.search(r'\bLIMIT\b', sql, re.IGNORECASE) == None:
+        return False
+    return not any(isinstance(param, str) and param.startswith('%') for param in params or [])
+
+EXPLAINERS = {
+    'mysql': explainMysql,
+    'sqlite': explainSqlite,
+}
+
+class Command(BaseCommand):
+    help = "runs EXPLAIN on every query of each catalog page and fails if any reads a whole table or index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true',
+            help="Print the plan of every query, not just the ones that scan.")
+
+    def handle(self, *args, **kwargs):
+        explain = EXPLAINERS.get(connection.vendor)
+        if explain == None:
+            raise CommandError("Don't know how to read " + connection.vendor + " query plans.")
+
+        courseCount = Course.objects.count()
+        if courseCount < 1000:
+            print("Warning: only " + str(courseCount) + " courses in the database. "
+                + "Plans on small tables may scan where real data wouldn't.")
+
+        # Record what each page sends to the database, with its parameters.
+        queries = []
+        def record(execute, sql, params, many, context):
+            queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        client = Client()
+        failures = 0
+
+        # Skip the page cache so every page goes to the database. The test
+        # client's requests come from 'testserver', which has to be allowed.
+        with override_settings(CACHES={ 'default': { 'BACKEND': 'django.core.cache.backends.dummy.DummyCache' } },
+                PAGE_CACHE='default', ALLOWED_HOSTS=['testserver']):
+            urls = sampleUrls()
+
+            # Things built once per data generation, like the search
+            # index, read whole tables on purpose. Build them first
+            # so only the queries each request makes are checked.
+            for name, url in urls:
+                client.get(url)
+
+            for name, url in urls:
+                queries.clear()
+                with connection.execute_wrapper(record):
+                    response = client.get(url)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+
+                if response.status_code not in (200, 302):
+                    raise CommandError(name + " (" + url + ") returned " + str(response.status_code) + ".")
+
+                print(name + ": " + str(len(queries)) + " queries")
+                with connection.cursor() as cursor:
+                    for sql, params in queries:
+                        plan, scans, walks = explain(cursor, sql, params)
+                        scans = [table for table in scans if table not in SMALL_TABLES]
+                        walks = [table for table in walks if table not in SMALL_TABLES]
+                        if boundedWalk(sql, params):
+                            walks = []
+
+                        if len(scans) > 0 or len(walks) > 0 or kwargs['verbose_plans']:
+                            print("    " + sql)
+                            print("    params " + repr(params))
+                            for line in plan:
+                                print("        " + line)
+                        if len(scans) > 0:
+                            print("    FULL SCAN of " + ", ".join(scans))
+                        if len(walks) > 0:
+                            print("    FULL INDEX SCAN of " + ", ".join(walks))
+                        if len(scans) > 0 or len(walks) > 0:
+                            failures += 1
+
+        if failures > 0:
+            raise CommandError(str(failures) + " queries read a whole table or index.")
+
+        print("No full scans.")
@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from catalog.export import CATALOG_TABLES, TERM_TABLES, FORMATS, DEFAULT_FORMAT, exportTable
+from catalog.models import Term, ScrapeState
+
+from datetime import datetime
+
+import json
+import os
+import time
+
+class Command(BaseCommand):
+    help = "exports the catalog to columnar files, partitioned by term, for analysis"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--out',
+            help="Directory to export to. Defaults to EXPORT_DIR.")
+        parser.add_argument('--format', choices=FORMATS, default=DEFAULT_FORMAT,
+            help="File format. Parquet needs pyarrow installed; otherwise gzipped CSV is used.")
+        parser.add_argument('--full', action='store_true',
+            help="Export every term, instead of only terms that changed since the last export.")
+        parser.add_argument('--chunk-size', type=int, default=5000,
+            help="Number of rows read from the database and written at a time.")
+
+    def handle(self, *args, **kwargs):
+        startTime = time.perf_counter()
+        out = kwargs['out'] or settings.EXPORT_DIR
+        chunkSize = max(1, kwargs['chunk_size'])
+        fileFormat = kwargs['format']
+        os.makedirs(out, exist_ok=True)
+
+        # The manifest records when each term was last exported,
+        # so the next export can skip terms that haven't changed.
+        manifestPath = os.path.join(out, 'manifest.json')
+        manifest = { 'format': fileFormat, 'terms': {} }
+        if os.path.exists(manifestPath) and not kwargs['full']:
+            with open(manifestPath) as f:
+                manifest = json.load(f)
+
+            # Files in another format don't count.
+            if manifest.get('format') != fileFormat:
+                manifest = { 'format': fileFormat, 'terms': {} }
+
+        # Term code -> when classes in the term last changed
+        lastChanged = dict(ScrapeState.objects.values('term_id')
+            .annotate(lastChanged=Max('lastChanged')).values_list('term_id', 'lastChanged'))
+
+        def changed(termCode):
+            exported = manifest['terms'].get(termCode)
+            if exported == None:
+                return True
+            return lastChanged.get(termCode) != None and lastChanged[termCode] > datetime.fromisoformat(exported)
+
+        # Tables that aren't split by term are small enough to write whole each time.
+        for name, queryset, columns in CATALOG_TABLES:
+            rows = exportTable(queryset(), columns, os.path.join(out, name), fileFormat, chunkSize)
+            print("Exported " + str(rows) + " " + name)
+
+        termCodes = sorted(Term.objects.values_list('code', flat=True))
+        exportedTerms = 0
+        for termCode in termCodes:
+            if not changed(termCode):
+                continue
+
+            # Note the time before reading, so changes made
+            # while exporting get picked up next time.
+            started = timezone.now()
+
+            partition = os.path.join(out, 'term=' + termCode)
+            os.makedirs(partition, exist_ok=True)
+
+            counts = []
+            for name, queryset, columns in TERM_TABLES:
+                rows = exportTable(queryset(termCode), columns, os.path.join(partition, name), fileFormat, chunkSize)
+                counts.append(str(rows) + " " + name)
+            print("Exported term " + termCode + ": " + ", ".join(counts))
+
+            # Save progress after each term, so an interrupted
+            # export doesn't start over.
+            manifest['terms'][termCode] = started.isoformat()
+            manifest['exported'] = started.isoformat()
+            with open(manifestPath + '.tmp', 'w') as f:
+                json.dump(manifest, f, indent=4)
+            os.replace(manifestPath + '.tmp', manifestPath)
+            exportedTerms += 1
+
+        print("Done! Exported " + str(exportedTerms) + " of " + str(len(termCodes)) + " terms to " + out
+            + " as " + fileFormat + " in " + format(time.perf_counter() - startTime, '.1f') + "s.")
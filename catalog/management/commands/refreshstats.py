@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from catalog.models import Term
+from catalog.generation import bumpGeneration
+from catalog.stats import refreshCourseTermStats, refreshSiteStats
+
+class Command(BaseCommand):
+    help = "rebuilds the precomputed enrollment stats from the classes in the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--term', action='append',
+            help="Only rebuild stats for this term code. Can be given more than once.")
+
+    def handle(self, *args, **kwargs):
+        termCodes = kwargs['term'] or list(Term.objects.order_by('-code').values_list('code', flat=True))
+
+        # One term at a time, so memory use doesn't grow with history.
+        rows = 0
+        for termCode in termCodes:
+            with transaction.atomic():
+                rows += refreshCourseTermStats(termCode)
+
+        refreshSiteStats()
+        bumpGeneration()
+
+        print("Done! Wrote " + str(rows) + " course term stats for " + str(len(termCodes)) + " terms.")
@@ -0,0 +1,111 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.utils import timezone
+from catalog.classparser import BACKENDS, DEFAULT_BACKEND
+from catalog.httpclient import HttpClient
+from catalog.loader import ClassLoader
+from catalog.pagecache import PageCache
+from catalog.pipeline import Pipeline
+from catalog.scrapers import TermScraper, SubjectScraper, CourseScraper, ClassScraper, startRun, finishRun
+
+import json
+import os
+import time
+
+class Command(BaseCommand):
+    help = "updates terms, subjects, courses and classes in one pipelined run"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4,
+            help="Number of pages to fetch and parse at once.")
+        parser.add_argument('--rate', type=float, default=5.0,
+            help="Maximum requests per second sent to any one host (0 for no limit).")
+        parser.add_argument('--full', action='store_true',
+            help="Scrape classes for every term, instead of only current and upcoming terms and pages never scraped before.")
+        parser.add_argument('--no-cache', action='store_true',
+            help="Don't keep a copy of fetched pages in the local page cache.")
+        parser.add_argument('--parser', choices=sorted(BACKENDS), default=DEFAULT_BACKEND,
+            help="HTML parser backend to use.")
+        parser.add_argument('--skip-courses', action='store_true',
+            help="Don't fetch course lists from the v2 API; courses are still added from class pages.")
+        parser.add_argument('--resume', action='store_true',
+            help="Carry on with the last run that didn't finish, skipping class pages it already loaded.")
+        parser.add_argument('--report',
+            help="Where to write the JSON run report. Defaults to a timestamped file in SCRAPE_REPORT_DIR.")
+
+    def handle(self, *args, **kwargs):
+        started = timezone.now()
+        startTime = time.perf_counter()
+        concurrency = max(1, kwargs['concurrency'])
+
+        # One connection pool, page cache and set of
+        # lookup maps shared by every stage.
+        cache = PageCache()
+        client = HttpClient(cache=None if kwargs['no_cache'] else cache, rate=kwargs['rate'], poolSize=concurrency)
+        loader = ClassLoader()
+
+        # Class pages are checkpointed against the run as they're
+        # loaded, so an interrupted run can be picked up with --resume.
+        run = startRun('scrape', full=kwargs['full'], resume=kwargs['resume'])
+
+        terms = TermScraper(client)
+        subjects = SubjectScraper(client)
+        courses = CourseScraper(client, loader, subjects.codes)
+        classes = ClassScraper(client, cache, loader, run,
+            full=run.full, parser=kwargs['parser'])
+
+        pipeline = Pipeline(concurrency)
+
+        # Start on everything we can with the terms and subjects we
+        # already know about, and add more work as new ones turn up.
+        def scrapeFor(termCodes, subjectCodes):
+            if len(termCodes) == 0 or len(subjectCodes) == 0:
+                return
+            pipeline.submitAll('classes', classes.scrape, classes.units(termCodes, subjectCodes), classes.load)
+
+        def coursesFor(termCodes, subjectCodes):
+            if kwargs['skip_courses']:
+                return
+            pipeline.submitAll('courses', courses.fetchSubject, [(code,) for code in sorted(subjectCodes)],
+                lambda args, result: courses.load(result))
+            pipeline.submitAll('courses', courses.fetchTerm, [(code,) for code in sorted(termCodes, reverse=True)],
+                lambda args, result: courses.load(result))
+
+        def termsLoaded(args, result):
+            added = terms.load(result)
+            scrapeFor(added, list(subjects.codes))
+            coursesFor(added, [])
+
+        def subjectsLoaded(args, result):
+            added = subjects.load(result)
+            scrapeFor(list(terms.codes), added)
+            coursesFor([], added)
+
+        pipeline.submit('terms', terms.fetch, (), termsLoaded)
+        pipeline.submit('subjects', subjects.fetch, (), subjectsLoaded)
+        coursesFor(list(terms.codes), list(subjects.codes))
+        scrapeFor(list(terms.codes), list(subjects.codes))
+
+        pipeline.run()
+        finishRun(run)
+
+        report = {
+            'started': started.isoformat(),
+            'finished': timezone.now().isoformat(),
+            'seconds': round(time.perf_counter() - startTime, 3),
+            'options': dict((name, kwargs[name]) for name in ['concurrency', 'rate', 'full', 'no_cache', 'parser', 'skip_courses', 'resume']),
+            'stages': pipeline.report(),
+            'counts': dict(loader.counts, terms=terms.new, subjects=subjects.new, errors=classes.errors),
+            # Term, subject and course fetches that failed; class pages are in ScrapeError.
+            'failures': pipeline.failures,
+        }
+
+        path = kwargs['report'] or os.path.join(settings.SCRAPE_REPORT_DIR, 'scrape-' + started.strftime('%Y%m%d-%H%M%S') + '.json')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=4)
+
+        print("Done! Found " + str(terms.new) + " new terms and " + str(subjects.new) + " new subjects. " + classes.summary())
+        if len(pipeline.failures) > 0:
+            print(str(len(pipeline.failures)) + " other tasks failed; see the run report.")
+        print("Wrote run report to " + path)
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from catalog.models import Course
+from catalog.generation import bumpGeneration
+from catalog.loader import ClassLoader
+from catalog.stats import refreshSiteStats
+from catalog.synthetic import SyntheticCatalog
+
+import contextlib
+import io
+import time
+
+class Command(BaseCommand):
+    help = "fills an empty database with a made-up catalog, for benchmarking"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=int, default=30,
+            help="Number of years of terms, three terms a year.")
+        parser.add_argument('--subjects', type=int, default=100)
+        parser.add_argument('--courses', type=int, default=50,
+            help="Number of courses in each subject.")
+        parser.add_argument('--offered', type=float, default=0.4,
+            help="Share of a subject's courses offered in each term.")
+        parser.add_argument('--sections', type=int, default=3,
+            help="Average number of lecture sections per offering.")
+        parser.add_argument('--instructors', type=int, default=4000)
+        parser.add_argument('--seed', type=int, default=0,
+            help="The same seed and sizes always give the same catalog.")
+
+    def handle(self, *args, **kwargs):
+        if Course.objects.exists():
+            raise CommandError("The database already has courses; seed an empty one instead.")
+
+        startTime = time.perf_counter()
+        catalog = SyntheticCatalog(years=kwargs['years'], subjects=kwargs['subjects'], courses=kwargs['courses'],
+            offered=kwargs['offered'], sections=kwargs['sections'], instructors=kwargs['instructors'], seed=kwargs['seed'])
+        catalog.createTermsAndSubjects()
+
+        loader = ClassLoader()
+        classes = 0
+        for termCode, termName in catalog.terms:
+            # The loader prints a line for every page; keep that quiet.
+            with contextlib.redirect_stdout(io.StringIO()):
+                for subject, subjectName in catalog.subjects:
+                    page = catalog.page(termCode, subject)
+                    loader.loadPage(page, termCode)
+                    classes += len(page)
+
+            print("Seeded " + termName + " (" + str(classes) + " classes so far)")
+
+        refreshSiteStats()
+        bumpGeneration()
+
+        print("Done! Seeded " + str(len(catalog.terms)) + " terms, " + str(len(catalog.subjects)) + " subjects, "
+            + str(catalog.courseCount()) + " courses and " + str(classes) + " classes in "
+            + format(time.perf_counter() - startTime, '.1f') + "s.")
@@ -0,0 +1,166 @@
+"""Timing of catalog requests, by URL name.
+
+For a sample of requests, the middleware counts the SQL queries
+made and times the database, template rendering and the request as
+a whole. Each sampled response gets a Server-Timing header with
+those numbers, so they show up in the browser's developer tools,
+and they're added to histograms served at /metrics in Prometheus'
+text format.
+
+Histograms are kept in memory by each process and start over when
+it restarts, which Prometheus handles like any counter reset. With
+several worker processes, /metrics shows the one that answered."""
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseNotFound
+from django.template.base import Template
+from contextlib import ExitStack
+
+import hmac
+import random
+import threading
+import time
+
+# Upper bounds of the histogram buckets. Same as Prometheus' defaults for times.
+SECONDS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+QUERIES_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+# Metric name -> (help text, buckets)
+HISTOGRAMS = {
+    'waterlook_request_seconds': ("Time to respond to a request.", SECONDS_BUCKETS),
+    'waterlook_request_db_seconds': ("Time a request spent waiting on the database.", SECONDS_BUCKETS),
+    'waterlook_request_render_seconds': ("Time a request spent rendering templates.", SECONDS_BUCKETS),
+    'waterlook_request_queries': ("SQL queries made by a request.", QUERIES_BUCKETS),
+}
+
+# Metric name -> { view name -> [count per bucket..., count, sum] }
+observed = dict((name, {}) for name in HISTOGRAMS)
+observedLock = threading.Lock()
+
+# Timings of the request being handled on this thread, if it's sampled.
+current = threading.local()
+
+def observe(name, view, value):
+    buckets = HISTOGRAMS[name][1]
+    with observedLock:
+        counts = observed[name].setdefault(view, [0] * len(buckets) + [0, 0])
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                counts[i] += 1
+        counts[-2] += 1
+        counts[-1] += value
+
+class Timings:
+    """What one sampled request has spent so far."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.render = 0.0
+
+        # Templates render each other (i.e. {% extends %}),
+        # so only the outermost one is timed.
+        self.renderDepth = 0
+
+    def timeQuery(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+# Template rendering has no hook of its own, so the middleware wraps
+# the template's _render the same way Django's test runner does.
+originalRender = None
+
+def timedRender(self, context):
+    timings = getattr(current, 'timings', None)
+    if timings == None:
+        return originalRender(self, context)
+
+    timings.renderDepth += 1
+    start = time.perf_counter()
+    try:
+        return originalRender(self, context)
+    finally:
+        timings.renderDepth -= 1
+        if timings.renderDepth == 0:
+            timings.render += time.perf_counter() - start
+
+class RequestMetricsMiddleware:
+    """Times a METRICS_SAMPLE_RATE share of requests."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+        global originalRender
+        if Template._render is not timedRender:
+            originalRender = Template._render
+            Template._render = timedRender
+
+    def __call__(self, request):
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+
+        timings = Timings()
+        current.timings = timings
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings.timeQuery))
+                response = self.get_response(request)
+        finally:
+            current.timings = None
+        total = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.url_name if match != None and match.url_name != None else 'unmatched'
+
+        observe('waterlook_request_seconds', view, total)
+        observe('waterlook_request_db_seconds', view, timings.db)
+        observe('waterlook_request_render_seconds', view, timings.render)
+        observe('waterlook_request_queries', view, timings.queries)
+
+        response['Server-Timing'] = ', '.join([
+            'db;dur=' + format(timings.db * 1000, '.1f') + ';desc="' + str(timings.queries) + ' queries"',
+            'render;dur=' + format(timings.render * 1000, '.1f'),
+            'total;dur=' + format(total * 1000, '.1f'),
+        ])
+        return response
+
+def formatMetrics():
+    """The histograms in Prometheus' text exposition format."""
+    with observedLock:
+        snapshot = dict((name, dict((view, list(counts)) for view, counts in views.items()))
+            for name, views in observed.items())
+
+    lines = []
+    for name, (helpText, buckets) in HISTOGRAMS.items():
+        lines.append('# HELP ' + name + ' ' + helpText)
+        lines.append('# TYPE ' + name + ' histogram')
+        for view, counts in sorted(snapshot[name].items()):
+            label = 'view="' + view + '"'
+            for bound, count in zip(buckets, counts):
+                lines.append(name + '_bucket{' + label + ',le="' + str(bound) + '"} ' + str(count))
+            lines.append(name + '_bucket{' + label + ',le="+Inf"} ' + str(counts[-2]))
+            lines.append(name + '_sum{' + label + '} ' + repr(float(counts[-1])))
+            lines.append(name + '_count{' + label + '} ' + str(counts[-2]))
+    return '\n'.join(lines) + '\n'
+
+def metricsAllowed(request):
+    """Whether a request may read /metrics: it has the METRICS_TOKEN
+    bearer token, or comes from one of METRICS_ALLOWED_IPS."""
+    if settings.METRICS_TOKEN != '':
+        expected = 'Bearer ' + settings.METRICS_TOKEN
+        if hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', '').encode(), expected.encode()):
+            return True
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+def metricsView(request):
+    """Serves the histograms, only to scrapers that metricsAllowed."""
+    if not metricsAllowed(request):
+        return HttpResponseNotFound()
+    return HttpResponse(formatMetrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
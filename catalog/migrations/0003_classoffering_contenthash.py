@@ -0,0 +1,18 @@
+# Generated by Django 3.1 on 2026-10-18 09:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_auto_20201101_2209'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classoffering',
+            name='contentHash',
+            field=models.CharField(max_length=40, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.1 on 2026-10-18 09:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_classoffering_contenthash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(max_length=20)),
+                ('lastFetched', models.DateTimeField()),
+                ('hasData', models.BooleanField()),
+                ('lastChanged', models.DateTimeField(null=True)),
+                ('lastUpdated', models.CharField(blank=True, max_length=100)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.subject')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.term')),
+            ],
+            options={
+                'unique_together': {('term', 'subject', 'level')},
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.1 on 2026-10-18 09:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_scrapestate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('command', models.CharField(max_length=50)),
+                ('full', models.BooleanField(default=False)),
+                ('started', models.DateTimeField()),
+                ('finished', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ScrapeError',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(max_length=20)),
+                ('error', models.TextField()),
+                ('traceback', models.TextField()),
+                ('rawPage', models.BinaryField(null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.scraperun')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.subject')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.term')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='scrapestate',
+            name='lastRun',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='catalog.scraperun'),
+        ),
+    ]
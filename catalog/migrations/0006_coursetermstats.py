@@ -0,0 +1,66 @@
+# Generated by Django 3.1 on 2026-10-18 10:03
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+import django.db.models.deletion
+
+
+def fillCourseTermStats(apps, schema_editor):
+    """Course pages read these rows, so work them out for the
+    classes already in the database instead of waiting for a scrape.
+    Same sums as catalog.stats.refreshCourseTermStats, written against
+    the historical models so later changes there can't break this."""
+    ClassLocation = apps.get_model('catalog', 'ClassLocation')
+    ClassOffering = apps.get_model('catalog', 'ClassOffering')
+    CourseTermStats = apps.get_model('catalog', 'CourseTermStats')
+
+    # A class counts as cancelled if any of its locations is.
+    cancelled = ClassLocation.objects.filter(classOffering=OuterRef('pk'), isCancelled=True)
+
+    # (Course id, term code, section type) -> CourseTermStats
+    stats = {}
+    for courseId, termCode, sectionName, total, capacity, isCancelled in (ClassOffering.objects
+            .annotate(isCancelled=Exists(cancelled))
+            .values_list('courseOffering__course_id', 'courseOffering__term_id', 'sectionName',
+                'enrollmentTotal', 'enrollmentCapacity', 'isCancelled')
+            .iterator()):
+        key = (courseId, termCode, sectionName.split(' ', 1)[0])
+        if key not in stats:
+            stats[key] = CourseTermStats(course_id=courseId, term_id=termCode, sectionType=key[2])
+
+        if not isCancelled:
+            stats[key].totalEnrollment += total
+            stats[key].maxEnrollment += capacity
+            stats[key].sectionCount += 1
+
+    for row in stats.values():
+        row.averageSize = int(row.totalEnrollment / row.sectionCount) if row.sectionCount > 0 else None
+
+    CourseTermStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_scraperun_scrapeerror'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseTermStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sectionType', models.CharField(max_length=10)),
+                ('totalEnrollment', models.IntegerField(default=0)),
+                ('maxEnrollment', models.IntegerField(default=0)),
+                ('sectionCount', models.IntegerField(default=0)),
+                ('averageSize', models.IntegerField(null=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.course')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.term')),
+            ],
+            options={
+                'ordering': ['course', 'term', 'sectionType'],
+                'unique_together': {('course', 'term', 'sectionType')},
+            },
+        ),
+        migrations.RunPython(fillCourseTermStats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 3.1 on 2026-10-18 10:12
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def takeSiteStats(apps, schema_editor):
+    """The homepage and stats page read the snapshot, so take one
+    now instead of showing zeroes until the next scrape. Same numbers
+    as catalog.stats.refreshSiteStats, from the historical models."""
+    Subject, Course, Instructor, Term, CourseOffering, ClassOffering, CourseTermStats, SiteStats = (
+        apps.get_model('catalog', name) for name in ['Subject', 'Course', 'Instructor', 'Term',
+            'CourseOffering', 'ClassOffering', 'CourseTermStats', 'SiteStats'])
+
+    termCodes = Term.objects.order_by('code').values_list('code', flat=True)
+    largest = CourseTermStats.objects.order_by('-totalEnrollment', 'term_id').first()
+
+    SiteStats.objects.create(
+        subjectCount=Subject.objects.count(),
+        courseCount=Course.objects.count(),
+        instructorCount=Instructor.objects.count(),
+        termCount=Term.objects.count(),
+        courseOfferingCount=CourseOffering.objects.count(),
+        classCount=ClassOffering.objects.count(),
+        totalEnrollment=CourseTermStats.objects.aggregate(total=Sum('totalEnrollment'))['total'] or 0,
+        firstTerm_id=termCodes.first(),
+        lastTerm_id=termCodes.last(),
+        largestCourse_id=largest.course_id if largest != None else None,
+        largestTerm_id=largest.term_id if largest != None else None,
+        largestSectionType=largest.sectionType if largest != None else '',
+        largestEnrollment=largest.totalEnrollment if largest != None else 0,
+        updated=timezone.now(),
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_datageneration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subjectCount', models.IntegerField(default=0)),
+                ('courseCount', models.IntegerField(default=0)),
+                ('instructorCount', models.IntegerField(default=0)),
+                ('termCount', models.IntegerField(default=0)),
+                ('courseOfferingCount', models.IntegerField(default=0)),
+                ('classCount', models.IntegerField(default=0)),
+                ('totalEnrollment', models.IntegerField(default=0)),
+                ('largestSectionType', models.CharField(blank=True, max_length=10)),
+                ('largestEnrollment', models.IntegerField(default=0)),
+                ('updated', models.DateTimeField(null=True)),
+                ('firstTerm', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='catalog.term')),
+                ('largestCourse', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='catalog.course')),
+                ('largestTerm', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='catalog.term')),
+                ('lastTerm', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='catalog.term')),
+            ],
+        ),
+        migrations.RunPython(takeSiteStats, migrations.RunPython.noop),
+    ]
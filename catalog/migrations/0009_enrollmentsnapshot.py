@@ -0,0 +1,44 @@
+# Generated by Django 3.1 on 2026-10-18 10:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_sitestats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classoffering',
+            name='waitingCapacity',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='classoffering',
+            name='waitingTotal',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.CreateModel(
+            name='EnrollmentSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scraped', models.DateTimeField()),
+                ('enrollmentCapacity', models.IntegerField()),
+                ('enrollmentTotal', models.IntegerField()),
+                ('waitingCapacity', models.IntegerField(null=True)),
+                ('waitingTotal', models.IntegerField(null=True)),
+                ('classOffering', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.classoffering')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.term')),
+            ],
+            options={
+                'ordering': ['classOffering', 'scraped'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='enrollmentsnapshot',
+            index=models.Index(fields=['term', 'scraped'], name='catalog_enr_term_id_a43199_idx'),
+        ),
+    ]
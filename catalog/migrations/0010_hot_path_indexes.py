@@ -0,0 +1,25 @@
+# Generated by Django 3.1 on 2026-10-18 10:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_enrollmentsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='classlocation',
+            index=models.Index(fields=['classOffering', 'startDate'], name='catalog_cla_classOf_1664fd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='classoffering',
+            index=models.Index(fields=['courseOffering', 'sectionName'], name='catalog_cla_courseO_52b94e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollmentsnapshot',
+            index=models.Index(fields=['classOffering', 'scraped'], name='catalog_enr_classOf_983315_idx'),
+        ),
+    ]
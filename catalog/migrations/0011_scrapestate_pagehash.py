@@ -0,0 +1,18 @@
+# Generated by Django 3.1 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapestate',
+            name='pageHash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -47,6 +47,12 @@ class Term(models.Model):
         # Term codes are listed in ascending chronological order.
         return self.code > other.code
     
+    @staticmethod
+    def codeForDate(date):
+        """Code of the term a date falls in (i.e. 1209 for Fall 2020).
+        Codes are 1, then years since 1900, then the starting month."""
+        return str(date.year - 1900) + str(1 + 4 * ((date.month - 1) // 4))
+    
     def __eq__(self, other):
         return self.code == other.code
     
@@ -165,12 +171,26 @@ class ClassOffering(models.Model):
     # may be higher than enrollmentCapacity.
     enrollmentTotal = models.IntegerField()
     
+    # Size of the waiting list and number waiting,
+    # if the class has one.
+    waitingCapacity = models.IntegerField(null=True)
+    waitingTotal = models.IntegerField(null=True)
+    
+    # Hash of the scraped content for this class, including its
+    # reserves and locations. Lets the scraper skip classes that
+    # haven't changed since they were last loaded.
+    contentHash = models.CharField(max_length=40, null=True)
+    
     class Meta:
         unique_together = (('classNum', 'courseOffering'))
         
         # Order by sectionName for ease of reading, 
         # can see which are lectures and which tutorials.
         ordering = ['sectionName']
+        
+        # Classes are nearly always read by course offering, in the
+        # order above, so the index can stand in for the sort.
+        indexes = [models.Index(fields=['courseOffering', 'sectionName'])]
     
     def __str__(self):
         return str(self.courseOffering) + ' ' + str(self.classNum)
@@ -209,6 +229,9 @@ class ClassLocation(models.Model):
     class Meta:
         # Order by startDate since most 'real' class times are null
         ordering = ['startDate']
+        
+        # Locations are read by class, in the order above.
+        indexes = [models.Index(fields=['classOffering', 'startDate'])]
 
     def __str__(self):
         return str(self.classOffering)
@@ -226,6 +249,178 @@ class ClassReserve(models.Model):
     
     def __str__(self):
         return str(self.classOffering) + ' ' + str(reserveGroup)
+
+class CourseTermStats(models.Model):
+    """Model holding enrollment totals for one section type (i.e. LEC)
+    of a course in a term, so the course page doesn't need to add up
+    every class each time it's viewed. Refreshed by the scraper 
+    whenever classes for the course change."""
+    
+    course = models.ForeignKey('Course', on_delete=models.CASCADE)
+    term = models.ForeignKey('Term', on_delete=models.CASCADE)
+    
+    # i.e. 'LEC', 'TUT'
+    sectionType = models.CharField(max_length=10)
+    
+    # Summed over sections that weren't cancelled.
+    totalEnrollment = models.IntegerField(default=0)
+    maxEnrollment = models.IntegerField(default=0)
+    sectionCount = models.IntegerField(default=0)
+    
+    # Null if every section was cancelled.
+    averageSize = models.IntegerField(null=True)
+    
+    class Meta:
+        unique_together = (('course', 'term', 'sectionType'),)
+        ordering = ['course', 'term', 'sectionType']
+    
+    def __str__(self):
+        return str(self.course) + ' ' + str(self.term) + ' ' + self.sectionType
+
+class ScrapeState(models.Model):
+    """Model recording when the schedule of classes was last 
+    scraped for a term, subject and academic level, so that
+    terms that can't change anymore don't need to be fetched again."""
+    
+    term = models.ForeignKey('Term', on_delete=models.CASCADE)
+    subject = models.ForeignKey('Subject', on_delete=models.CASCADE)
+    
+    # 'undergraduate' or 'graduate'
+    level = models.CharField(max_length=20)
+    
+    # When the page was last fetched, and whether
+    # it had any classes on it.
+    lastFetched = models.DateTimeField()
+    hasData = models.BooleanField()
+    
+    # When any class on the page last changed in the database.
+    lastChanged = models.DateTimeField(null=True)
+    
+    # The page's own "last updated" marker, as shown on the page.
+    lastUpdated = models.CharField(max_length=100, blank=True)
+    
+    # Run that last loaded this page. Written in the same transaction
+    # as the page's classes, so it doubles as a checkpoint.
+    lastRun = models.ForeignKey('ScrapeRun', on_delete=models.SET_NULL, null=True)
+    
+    # SHA-256 of the raw page last loaded, as in its page cache entry.
+    # A 304 only says the page matches what's cached, which isn't
+    # loaded yet if it failed to parse or load.
+    pageHash = models.CharField(max_length=64, blank=True)
+    
+    class Meta:
+        unique_together = (('term', 'subject', 'level'),)
+    
+    def __str__(self):
+        return str(self.term) + ' ' + str(self.subject) + ' ' + self.level
+    
+class ScrapeRun(models.Model):
+    """Model representing one run of a scrape command. A run that
+    never finished can be picked up again with --resume."""
+    
+    # i.e. 'scrape' or 'scrapeclasses'
+    command = models.CharField(max_length=50)
     
+    # Whether every term was scraped, not just recent ones.
+    full = models.BooleanField(default=False)
+    
+    started = models.DateTimeField()
+    finished = models.DateTimeField(null=True)
+    
+    def __str__(self):
+        return self.command + ' ' + str(self.started)
+
+class ScrapeError(models.Model):
+    """Model representing a page that couldn't be fetched, parsed or 
+    loaded. The raw page is kept so the parser can be fixed against it."""
+    
+    run = models.ForeignKey('ScrapeRun', on_delete=models.CASCADE)
+    
+    term = models.ForeignKey('Term', on_delete=models.CASCADE)
+    subject = models.ForeignKey('Subject', on_delete=models.CASCADE)
+    level = models.CharField(max_length=20)
+    
+    error = models.TextField()
+    traceback = models.TextField()
+    
+    # Page as it was fetched, if we got that far.
+    rawPage = models.BinaryField(null=True)
+    
+    created = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return str(self.term) + ' ' + str(self.subject) + ' ' + self.level + ': ' + self.error
+
+class DataGeneration(models.Model):
+    """Model holding a single counter that goes up each time the
+    scrapers finish writing new data. Cached pages are keyed on it,
+    so they stay valid until the next scrape."""
+    
+    generation = models.IntegerField(default=0)
+    updated = models.DateTimeField(null=True)
+    
+    def __str__(self):
+        return str(self.generation)
+
+class EnrollmentSnapshot(models.Model):
+    """Model holding a class's enrollment numbers as of one scrape.
+    Rows are only ever added, and only when the numbers changed
+    since the last scrape, so a class's rows trace how its
+    enrollment moved over the term."""
+    
+    classOffering = models.ForeignKey('ClassOffering', on_delete=models.CASCADE)
+    
+    # Same as the class's, so one term's rows can be read
+    # without joining through the class and course offering.
+    term = models.ForeignKey('Term', on_delete=models.CASCADE)
+    
+    # When the page with these numbers was loaded.
+    scraped = models.DateTimeField()
+    
+    enrollmentCapacity = models.IntegerField()
+    enrollmentTotal = models.IntegerField()
+    waitingCapacity = models.IntegerField(null=True)
+    waitingTotal = models.IntegerField(null=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'scraped']),
+            models.Index(fields=['classOffering', 'scraped']),
+        ]
+        ordering = ['classOffering', 'scraped']
+    
+    def __str__(self):
+        return str(self.classOffering) + ' at ' + str(self.scraped)
+
+class SiteStats(models.Model):
+    """Model holding a single snapshot of site-wide numbers, taken
+    at the end of each scrape, so the homepage and stats page
+    don't need to count whole tables on every view."""
+    
+    subjectCount = models.IntegerField(default=0)
+    courseCount = models.IntegerField(default=0)
+    instructorCount = models.IntegerField(default=0)
+    termCount = models.IntegerField(default=0)
+    courseOfferingCount = models.IntegerField(default=0)
+    classCount = models.IntegerField(default=0)
+    
+    # Summed over sections that weren't cancelled.
+    totalEnrollment = models.IntegerField(default=0)
+    
+    # Terms covered; null until terms are scraped.
+    firstTerm = models.ForeignKey('Term', on_delete=models.SET_NULL, null=True, related_name='+')
+    lastTerm = models.ForeignKey('Term', on_delete=models.SET_NULL, null=True, related_name='+')
+    
+    # The most students one section type of a course has had in a term.
+    largestCourse = models.ForeignKey('Course', on_delete=models.SET_NULL, null=True, related_name='+')
+    largestTerm = models.ForeignKey('Term', on_delete=models.SET_NULL, null=True, related_name='+')
+    largestSectionType = models.CharField(max_length=10, blank=True)
+    largestEnrollment = models.IntegerField(default=0)
+    
+    updated = models.DateTimeField(null=True)
+    
+    def __str__(self):
+        return 'Site stats as of ' + str(self.updated)
+
 # import after functions: https://stackoverflow.com/questions/11698530/two-python-modules-require-each-others-contents-can-that-work
 from catalog import views
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.utils import timezone
+from pathlib import Path
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+class PageCache:
+    """On-disk cache of raw scraped pages.
+
+    Page bodies are stored gzipped under the SHA-256 of their content,
+    so identical pages (i.e. the many empty 'no matches' pages) are
+    only stored once. A small JSON index file for each key, such as
+    'classes/1209/CS/undergraduate', points at the body last seen for
+    that key along with when and where it was fetched from.
+
+    Safe to use from several threads at once, as long as no two
+    threads write the same key at the same time."""
+
+    def __init__(self, root=None):
+        self.root = Path(root or settings.SCRAPE_CACHE_DIR)
+
+    def objectPath(self, digest):
+        return self.root / 'objects' / digest[:2] / (digest + '.gz')
+
+    def indexPath(self, key):
+        return self.root / 'index' / (key + '.json')
+
+    def writeAtomic(self, path, data):
+        """Writes a file so that readers never see it half-written."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def put(self, key, content, **meta):
+        """Stores the raw content fetched for a key. Any extra keyword
+        arguments (url, etc.) are kept in the index entry."""
+        digest = hashlib.sha256(content).hexdigest()
+
+        path = self.objectPath(digest)
+        if not path.exists():
+            self.writeAtomic(path, gzip.compress(content))
+
+        entry = dict(meta, sha256=digest, fetched=timezone.now().isoformat())
+        self.writeAtomic(self.indexPath(key), json.dumps(entry).encode())
+        return digest
+
+    def meta(self, key):
+        """Index entry for a key, or None if it's never been cached."""
+        try:
+            with open(self.indexPath(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def get(self, key):
+        """Raw content last stored for a key, or None."""
+        entry = self.meta(key)
+        if entry == None:
+            return None
+
+        with open(self.objectPath(entry['sha256']), 'rb') as f:
+            return gzip.decompress(f.read())
+
+    def keys(self, prefix=''):
+        """All cached keys starting with prefix, in sorted order."""
+        indexRoot = self.root / 'index'
+        found = []
+        for path in (indexRoot / prefix).glob('**/*.json'):
+            found.append(path.relative_to(indexRoot).as_posix()[:-len('.json')])
+        return sorted(found)
+
+def classesKey(termCode, subject, academicLevel):
+    """Cache key for one schedule of classes page."""
+    return 'classes/' + str(termCode) + '/' + subject + '/' + academicLevel
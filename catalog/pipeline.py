@@ -0,0 +1,155 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from collections import deque
+
+import time
+import traceback
+
+class StageTiming:
+    """Time spent on one stage of a pipeline."""
+
+    def __init__(self):
+        self.tasks = 0
+        self.failed = 0
+
+        # Wall clock time the first task was started
+        # and the last one finished
+        self.start = None
+        self.end = None
+
+        # Seconds spent working on worker threads, and
+        # handling results on the calling thread.
+        self.work = 0.0
+        self.load = 0.0
+
+    def report(self):
+        return {
+            'tasks': self.tasks,
+            'failed': self.failed,
+            'wall': round(self.end - self.start, 3) if self.start != None else 0,
+            'work': round(self.work, 3),
+            'load': round(self.load, 3),
+        }
+
+class FailedTask:
+    """What a task's function raised, passed back from the worker thread."""
+
+    def __init__(self, error, traceback):
+        self.error = error
+        self.traceback = traceback
+
+class Pipeline:
+    """Runs fetch and parse work on a pool of worker threads and hands
+    each result to a callback on the calling thread.
+
+    Callbacks can add more work, so one stage can feed the next as
+    soon as its results come in. Since callbacks all run on the thread
+    that called run(), that thread is the only one that needs to touch
+    the database. Only a bounded number of tasks are in flight at once
+    so results don't pile up faster than they're handled.
+
+    A task whose function or callback raises is recorded in failures
+    and skipped, and everything else carries on."""
+
+    def __init__(self, workers):
+        self.workers = max(1, workers)
+        self.maxPending = self.workers * 2
+
+        # (stage, function, iterator of argument tuples, callback)
+        self.queue = deque()
+        self.pending = {}
+
+        # Stage name -> StageTiming, in the order stages were first seen
+        self.stages = {}
+
+        # One dict per task that raised, for the run report
+        self.failures = []
+
+    def timing(self, stage):
+        if stage not in self.stages:
+            self.stages[stage] = StageTiming()
+        return self.stages[stage]
+
+    def submit(self, stage, function, args, callback):
+        """Queues function(*args) to run on a worker thread, and
+        callback(args, result) to run on this thread once it's done."""
+        self.submitAll(stage, function, [args], callback)
+
+    def submitAll(self, stage, function, argsList, callback):
+        """Like submit, for every argument tuple in an iterable. The
+        iterable is only read as workers free up, so it can be a generator."""
+        self.timing(stage)
+        self.queue.append((stage, function, iter(argsList), callback))
+
+    def nextTask(self):
+        """Takes the next task, going round-robin between everything
+        queued so that no one stage holds up the others."""
+        while len(self.queue) > 0:
+            stage, function, argsIter, callback = self.queue.popleft()
+            args = next(argsIter, None)
+            if args != None:
+                self.queue.append((stage, function, argsIter, callback))
+                return stage, function, args, callback
+        return None
+
+    def fail(self, stage, args, error, trace):
+        print("Error in " + stage + " task " + repr(args) + ": " + repr(error))
+        self.timing(stage).failed += 1
+        self.failures.append({
+            'stage': stage,
+            'args': [str(arg) for arg in args],
+            'error': repr(error),
+            'traceback': trace,
+        })
+
+    def run(self):
+        def timed(function, args):
+            start = time.perf_counter()
+            try:
+                result = function(*args)
+            except Exception as e:
+                # Formatted here, since the traceback is only
+                # current on the worker thread.
+                return FailedTask(e, traceback.format_exc()), time.perf_counter() - start
+            return result, time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                while len(self.pending) < self.maxPending:
+                    task = self.nextTask()
+                    if task == None:
+                        break
+
+                    stage, function, args, callback = task
+                    timing = self.timing(stage)
+                    if timing.start == None:
+                        timing.start = time.perf_counter()
+
+                    self.pending[executor.submit(timed, function, args)] = (stage, args, callback)
+
+                if len(self.pending) == 0:
+                    break
+
+                done, _ = wait(self.pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    stage, args, callback = self.pending.pop(future)
+                    result, duration = future.result()
+
+                    start = time.perf_counter()
+                    if isinstance(result, FailedTask):
+                        self.fail(stage, args, result.error, result.traceback)
+                    else:
+                        try:
+                            callback(args, result)
+                        except Exception as e:
+                            self.fail(stage, args, e, traceback.format_exc())
+                    end = time.perf_counter()
+
+                    timing = self.timing(stage)
+                    timing.tasks += 1
+                    timing.work += duration
+                    timing.load += end - start
+                    timing.end = end
+
+    def report(self):
+        return dict((stage, timing.report()) for stage, timing in self.stages.items())
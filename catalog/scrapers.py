@@ -0,0 +1,381 @@
+"""Scraping stages shared by the scrape commands.
+
+Each scraper splits its work into a fetch step, which only touches
+the network and can run on a worker thread, and a load step, which
+writes to the database and must run on the thread that owns the
+database connection. The scrape commands run them through a
+catalog.pipeline.Pipeline, or one after the other."""
+
+from catalog.models import *
+from catalog.classparser import DEFAULT_BACKEND, parseScheduleOfClasses
+from catalog.generation import bumpGeneration
+from catalog.stats import refreshSiteStats
+from catalog.httpclient import Page
+from catalog.pagecache import classesKey
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.db.utils import DataError, IntegrityError
+from django.utils import timezone
+from datetime import datetime
+
+import environ
+import hashlib
+import traceback
+
+# Environment should already be read in settings.py
+env = environ.Env()
+
+def startRun(command, full=False, resume=False):
+    """Returns the ScrapeRun to record progress against: the most
+    recent unfinished run of the command if resuming, or a new one."""
+    if resume:
+        run = ScrapeRun.objects.filter(command=command, finished=None).order_by('-started').first()
+        if run == None:
+            raise CommandError("No unfinished " + command + " run to resume.")
+
+        print("Resuming run started " + str(run.started))
+        return run
+
+    return ScrapeRun.objects.create(command=command, full=full, started=timezone.now())
+
+def finishRun(run):
+    run.finished = timezone.now()
+    run.save(update_fields=['finished'])
+
+    refreshSiteStats()
+
+    # Cached pages were rendered from the old data.
+    bumpGeneration()
+
+class FailedUnit:
+    """A page that couldn't be fetched, parsed or loaded."""
+
+    def __init__(self, error, content=None):
+        self.error = repr(error)
+        self.traceback = traceback.format_exc()
+        self.content = content
+
+class TermScraper:
+    """Adds new academic terms from the v3 API."""
+
+    def __init__(self, client):
+        self.client = client
+        self.new = 0
+
+        # Create existing terms as an in-memory set
+        # for fast comparisons
+        self.codes = set(Term.objects.values_list('code', flat=True))
+
+    def fetch(self):
+        # V3 API contains the list of all the academic terms.
+        return self.client.get(f"https://openapi.data.uwaterloo.ca/v3/Terms",
+            headers={
+                'Accept':'application/json',
+                'x-api-key': env("OPENDATA_V3_KEY")},
+            cacheKey='api/v3/terms').json()
+
+    def load(self, terms):
+        """Inserts terms that don't exist yet. Returns the codes of the new ones."""
+        added = []
+
+        for term in terms:
+            termCode = term['termCode']
+            termName = term['name']
+
+            if termCode not in self.codes:
+                print("Term found: " + str(termCode))
+                try:
+                    Term(code=termCode, name=termName).save()
+
+                    # Also update set with new term.
+                    self.codes.add(termCode)
+                    added.append(termCode)
+
+                except IntegrityError as e:
+                    print("Error inserting term: " + str(e))
+
+                except DataError as e:
+                    print("Error inserting term: " + str(e))
+
+        self.new += len(added)
+        return added
+
+class SubjectScraper:
+    """Adds new subjects from the v3 API."""
+
+    def __init__(self, client):
+        self.client = client
+        self.new = 0
+        self.codes = set(Subject.objects.values_list('code', flat=True))
+
+    def fetch(self):
+        return self.client.get(f"https://openapi.data.uwaterloo.ca/v3/Subjects",
+            headers={
+                'Accept':'application/json',
+                'x-api-key': env("OPENDATA_V3_KEY")},
+            cacheKey='api/v3/subjects').json()
+
+    def load(self, subjects):
+        """Inserts subjects that don't exist yet. Returns the codes of the new ones."""
+        added = []
+
+        for subject in subjects:
+            code = subject['code']
+            # Description gives "full name"
+            name = subject['description']
+
+            if code not in self.codes:
+                print("Subject found: " + str(code))
+                try:
+                    Subject(code=code, name=name).save()
+
+                    self.codes.add(code)
+                    added.append(code)
+
+                except IntegrityError as e:
+                    print("Error inserting subject: " + str(e))
+
+                except DataError as e:
+                    print("Error inserting subject: " + str(e))
+
+        self.new += len(added)
+        return added
+
+class CourseScraper:
+    """Adds new courses from the v2 API, listed by subject or by term.
+    Shares its map of known courses with the class loader."""
+
+    def __init__(self, client, loader, subjectCodes):
+        self.client = client
+        self.loader = loader
+        self.key = env("OPENDATA_V2_KEY")
+
+        # Courses can only be added under subjects we know about.
+        self.subjectCodes = subjectCodes
+
+    def fetchSubject(self, subjectCode):
+        print("Subject: " + subjectCode)
+        return self.client.get(
+            f"https://api.uwaterloo.ca/v2/courses/{subjectCode}.json?key={self.key}",
+            cacheKey='api/v2/courses/' + subjectCode).json()['data']
+
+    def fetchTerm(self, termCode):
+        print("Term: " + termCode)
+        return self.client.get(
+            f"https://api.uwaterloo.ca/v2/terms/{termCode}/courses.json?key={self.key}",
+            cacheKey='api/v2/terms/' + termCode + '/courses').json()['data']
+
+    def load(self, courses):
+        """Inserts courses that don't exist yet."""
+        known = []
+        for course in courses:
+            if course['subject'] in self.subjectCodes:
+                known.append({
+                    'subject': course['subject'],
+                    'catalog_number': str(course.get('catalog_number')),
+                    'title': course.get('title'),
+                })
+            else:
+                print("Skipping course under unknown subject: " + str(course['subject']))
+
+        try:
+            with transaction.atomic():
+                self.loader.resolveCourses(known)
+        except (DataError, IntegrityError) as e:
+            # One bad course (i.e. a title that's too long) fails the
+            # whole bulk insert, so add them one at a time instead and
+            # skip only the ones that fail.
+            print("Error inserting courses, adding them one at a time: " + str(e))
+            for course in known:
+                try:
+                    with transaction.atomic():
+                        self.loader.resolveCourses([course])
+                except (DataError, IntegrityError) as e:
+                    print("Error inserting course: " + str(e))
+
+class ClassScraper:
+    """Scrapes the schedule of classes, one (term, subject, level) page at a time."""
+
+    def __init__(self, client, cache, loader, run, full=False, replay=False, parser=DEFAULT_BACKEND):
+        self.client = client
+        self.cache = cache
+        self.loader = loader
+        self.full = full
+        self.replay = replay
+        self.parser = parser
+        self.errors = 0
+
+        # Progress is checkpointed against this run.
+        self.run = run
+
+        # Look up what's been scraped before, so we can skip
+        # pages for terms that are over and done with.
+        self.states = {}
+        for state in ScrapeState.objects.all():
+            self.states[(state.term_id, state.subject_id, state.level)] = state
+
+        self.currentTermCode = Term.codeForDate(timezone.now())
+
+    def units(self, termCodes, subjectCodes):
+        """Each (term, subject, level) page that needs scraping, most recent
+        terms first. Pages already done in this run are skipped."""
+        for unit in self.candidates(termCodes, subjectCodes):
+            state = self.states.get(unit)
+            if state == None or state.lastRun_id != self.run.id:
+                yield unit
+
+    def candidates(self, termCodes, subjectCodes):
+        termCodes = sorted(termCodes, reverse=True)
+        subjectCodes = sorted(subjectCodes)
+
+        if self.replay:
+            # Every cached page whose term and subject we know about.
+            cached = []
+            for key in self.cache.keys('classes'):
+                _, termCode, subjectCode, academicLevel = key.split('/')
+                if termCode in termCodes and subjectCode in subjectCodes:
+                    cached.append((termCode, subjectCode, academicLevel))
+
+            yield from sorted(cached, key=lambda unit: unit[0], reverse=True)
+            return
+
+        for termCode in termCodes:
+            for subjectCode in subjectCodes:
+                for academicLevel in ["undergraduate", "graduate"]:
+                    # Past terms don't change, so only scrape them
+                    # if we've never seen them before.
+                    if (self.full or termCode >= self.currentTermCode
+                        or (termCode, subjectCode, academicLevel) not in self.states):
+
+                        # Legacy: API call to get classes for this term.
+                        # response = requests.get(
+                        #     f"https://api.uwaterloo.ca/v2/terms/{termCode}/{subjectCode}/schedule.json?key={key}")
+                        #
+                        # classes = response.json()['data']
+
+                        yield (str(termCode), subjectCode, academicLevel)
+
+    def fetch(self, termCode, subject, academicLevel):
+        """Returns the raw schedule of classes page, fetching it
+        from the network or, in replay mode, from the page cache."""
+        assert(academicLevel == "undergraduate" or academicLevel == "graduate")
+        key = classesKey(termCode, subject, academicLevel)
+
+        if self.replay:
+            print("Replaying term " + str(termCode) + " subject " + subject)
+            return Page(self.cache.get(key)), datetime.fromisoformat(self.cache.meta(key)['fetched'])
+
+        print("Scraping term " + str(termCode) + " subject " + subject)
+        level = "grad" if academicLevel == "graduate" else "under"
+        url = f"https://classes.uwaterloo.ca/cgi-bin/cgiwrap/infocour/salook.pl?level={level}&sess={termCode}&subject={subject}"
+        print("fetching " + url)
+        return self.client.get(url, cacheKey=key), timezone.now()
+
+    def scrape(self, termCode, subject, academicLevel):
+        """Fetches and parses one schedule of classes page.
+        Returns the parsed classes, when the page was fetched, the
+        SHA-256 of its content and the content itself, which is kept
+        in case loading fails. Classes are None if the page hasn't
+        changed since it was last loaded. Returns a FailedUnit instead
+        if anything goes wrong."""
+        try:
+            page, fetched = self.fetch(termCode, subject, academicLevel)
+        except Exception as e:
+            return FailedUnit(e)
+
+        digest = hashlib.sha256(page.content).hexdigest()
+
+        # Nothing to do if the server says the page is the same as what's
+        # cached, and what's cached is what we loaded last time, unless
+        # we're rebuilding everything. The cached page may never have been
+        # loaded if it failed to parse or the run stopped before loading it.
+        state = self.states.get((termCode, subject, academicLevel))
+        if page.notModified and not self.full and state != None and state.pageHash == digest:
+            print("Not modified: term " + str(termCode) + " subject " + subject)
+            return None, fetched, digest, page.content
+
+        try:
+            return parseScheduleOfClasses(page.content, termCode, subject, academicLevel, backend=self.parser), fetched, digest, page.content
+        except Exception as e:
+            # Usually a page laid out in a way the parser doesn't expect.
+            return FailedUnit(e, page.content)
+
+    def load(self, unit, result):
+        """Writes the classes scraped for a unit and records that it was
+        scraped, all in one transaction. Units that failed are quarantined
+        to the ScrapeError table instead."""
+        if isinstance(result, FailedUnit):
+            self.quarantine(unit, result)
+            return
+
+        counts = dict(self.loader.counts)
+        try:
+            with transaction.atomic():
+                self.save(unit, result)
+        except Exception as e:
+            # Anything from bad data on the page (i.e. a number that isn't
+            # one) to a bug in the loader. Only this page is lost; whatever
+            # the loader had mapped or counted from it was rolled back.
+            self.loader.reload()
+            self.loader.counts.update(counts)
+
+            termCode, subjectCode, academicLevel = unit
+            state = ScrapeState.objects.filter(term_id=termCode, subject_id=subjectCode, level=academicLevel).first()
+            if state != None:
+                self.states[unit] = state
+            else:
+                self.states.pop(unit, None)
+
+            self.quarantine(unit, FailedUnit(e, result[3]))
+
+    def save(self, unit, result):
+        termCode, subjectCode, academicLevel = unit
+        classes, fetched, digest = result[:3]
+
+        state = self.states.get(unit)
+
+        if classes == None:
+            state.lastFetched = fetched
+            state.lastRun = self.run
+            state.save(update_fields=['lastFetched', 'lastRun'])
+            return
+
+        changed = self.loader.loadPage(classes, termCode)
+
+        if state == None:
+            state = ScrapeState(term_id=termCode, subject_id=subjectCode, level=academicLevel)
+            self.states[unit] = state
+
+        state.lastFetched = fetched
+        state.hasData = len(classes) > 0
+        state.lastUpdated = classes[0]['last_updated'] if len(classes) > 0 else ""
+        state.lastRun = self.run
+        state.pageHash = digest
+        if changed > 0:
+            state.lastChanged = timezone.now()
+        state.save()
+
+    def quarantine(self, unit, failure):
+        termCode, subjectCode, academicLevel = unit
+        print("Error scraping term " + termCode + " subject " + subjectCode + " (" + academicLevel + "): " + failure.error)
+
+        ScrapeError.objects.create(
+            run=self.run,
+            term_id=termCode,
+            subject_id=subjectCode,
+            level=academicLevel,
+            error=failure.error,
+            traceback=failure.traceback,
+            rawPage=failure.content,
+        )
+        self.errors += 1
+
+    def summary(self):
+        counts = self.loader.counts
+        return ("Classes: " + str(counts['new']) + " new, "
+            + str(counts['updated']) + " updated, "
+            + str(counts['unchanged']) + " unchanged, "
+            + str(counts['snapshots']) + " enrollment snapshots. Added "
+            + str(counts['courses']) + " new courses and "
+            + str(counts['instructors']) + " new instructors. "
+            + str(self.errors) + " pages failed; see ScrapeError.")
@@ -0,0 +1,226 @@
+"""Search over courses and instructors.
+
+Courses are indexed by subject, catalog number and name, along with
+the names their offerings have had and the topics of their classes.
+Instructors are indexed by first and last name.
+
+The index is an inverted index kept in memory: each token maps to the
+documents containing it, and a sorted vocabulary answers prefix
+queries with a binary search. Terms with no prefix match fall back to
+tokens that share enough trigrams with them, so small typos still
+find something. It's built from the database the first time it's
+needed and rebuilt whenever the data generation changes, so it always
+matches the last scrape."""
+
+from catalog.generation import perGeneration
+from catalog.models import *
+from bisect import bisect_left
+from django.urls import reverse
+
+import heapq
+import re
+import unicodedata
+
+# How much a match in each field counts towards a document's score.
+FIELD_WEIGHTS = {
+    'subject': 3.0,
+    'code': 3.0,
+    'name': 2.0,
+    'offeringName': 1.5,
+    'topic': 1.0,
+    'instructor': 3.0,
+}
+
+# Exact tokens rank above prefixes, which rank above fuzzy matches.
+PREFIX_FACTOR = 0.8
+FUZZY_FACTOR = 0.5
+
+# Fuzzy matches need at least this share of trigrams in common.
+MIN_SIMILARITY = 0.25
+
+# Most vocabulary tokens a single query term can expand to, so very
+# short prefixes (i.e. 'c') don't touch the whole index.
+MAX_EXPANSIONS = 500
+
+def tokenize(text):
+    """Lowercase tokens of some text, i.e. 'CS241E Algebra' -> ['cs', '241e', 'algebra'].
+    Accents are dropped, so 'Müller' and 'muller' give the same token."""
+    if text == None:
+        return []
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return re.findall(r'[^\W\d_]+|\d+[^\W\d_]*', text)
+
+def trigrams(token):
+    padded = ' ' + token + ' '
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+class SearchIndex:
+    """Inverted index over courses and instructors. Build it with
+    SearchIndex.build(); after that it's read-only and safe to share
+    between threads."""
+
+    def __init__(self):
+        # Document number -> (kind, label, url)
+        self.documents = []
+
+        # Document number -> Course id, for course documents
+        self.courseIds = {}
+
+        # Token -> { document number -> field weight }
+        self.postings = {}
+
+        # Every token in sorted order, for prefix lookups,
+        # and trigram -> tokens containing it, for fuzzy ones.
+        self.vocabulary = []
+        self.trigrams = {}
+
+    def add(self, kind, label, url):
+        self.documents.append((kind, label, url))
+        return len(self.documents) - 1
+
+    def addText(self, document, field, text):
+        weight = FIELD_WEIGHTS[field]
+        for token in tokenize(text):
+            documents = self.postings.setdefault(token, {})
+            if documents.get(document, 0) < weight:
+                documents[document] = weight
+
+    def finish(self):
+        self.vocabulary = sorted(self.postings)
+        for token in self.vocabulary:
+            for trigram in trigrams(token):
+                self.trigrams.setdefault(trigram, []).append(token)
+
+    @staticmethod
+    def build():
+        """Reads every course and instructor from the database into a new index."""
+        index = SearchIndex()
+        coursesUrl = reverse('courses')
+        instructorsUrl = reverse('instructors')
+
+        # Course id -> document number
+        courseDocuments = {}
+        for courseId, subjectId, code, name in Course.objects.values_list('id', 'subject_id', 'code', 'name').order_by('subject_id', 'code'):
+            document = index.add('course', subjectId + ' ' + code + (' - ' + name if name else ''),
+                coursesUrl + subjectId + '/' + code + '/')
+            courseDocuments[courseId] = document
+            index.courseIds[document] = courseId
+            index.addText(document, 'subject', subjectId)
+            index.addText(document, 'code', code)
+            index.addText(document, 'name', name)
+
+        # Names and topics repeat across terms, so only read each once.
+        for courseId, name in CourseOffering.objects.values_list('course_id', 'name').distinct():
+            index.addText(courseDocuments[courseId], 'offeringName', name)
+
+        for courseId, topic in (ClassOffering.objects.exclude(topic=None)
+                .values_list('courseOffering__course_id', 'topic').distinct()):
+            index.addText(courseDocuments[courseId], 'topic', topic)
+
+        for instructorId, firstName, lastName in Instructor.objects.values_list('id', 'firstName', 'lastName'):
+            document = index.add('instructor', firstName + ' ' + lastName, instructorsUrl + str(instructorId) + '/')
+            index.addText(document, 'instructor', firstName)
+            index.addText(document, 'instructor', lastName)
+
+        index.finish()
+        return index
+
+    def expand(self, term):
+        """Returns a list of (token, factor) that a query term matches."""
+        matches = []
+        if term in self.postings:
+            matches.append((term, 1.0))
+
+        start = bisect_left(self.vocabulary, term)
+        for token in self.vocabulary[start:start + MAX_EXPANSIONS]:
+            if not token.startswith(term):
+                break
+            if token != term:
+                matches.append((token, PREFIX_FACTOR))
+
+        if len(matches) > 0:
+            return matches
+
+        # No prefix matches; look for tokens that are spelled similarly.
+        termTrigrams = trigrams(term)
+        shared = {}
+        for trigram in termTrigrams:
+            for token in self.trigrams.get(trigram, []):
+                shared[token] = shared.get(token, 0) + 1
+
+        for token, count in shared.items():
+            similarity = count / len(termTrigrams | trigrams(token))
+            if similarity >= MIN_SIMILARITY:
+                matches.append((token, FUZZY_FACTOR * similarity))
+
+        matches.sort(key=lambda match: -match[1])
+        return matches[:MAX_EXPANSIONS]
+
+    def matchingCourses(self, term):
+        """Ids of the courses with a word in their subject, catalog
+        number or name that starts with term. Unlike search, there's
+        no fuzzy matching and no limit on how many tokens it expands to."""
+        courseIds = set()
+        start = bisect_left(self.vocabulary, term)
+        for token in self.vocabulary[start:]:
+            if not token.startswith(term):
+                break
+            for document, weight in self.postings[token].items():
+                # Postings keep the best field's weight, and only those
+                # three fields weigh as much as a course's name.
+                if document in self.courseIds and weight >= FIELD_WEIGHTS['name']:
+                    courseIds.add(self.courseIds[document])
+        return courseIds
+
+    def search(self, query, limit=20):
+        """Documents matching every term of the query, best first, as
+        a list of dicts with the kind, label, url and score of each."""
+        terms = tokenize(re.sub(r'([A-Za-z])(\d)', r'\1 \2', query))
+        if len(terms) == 0:
+            return []
+
+        scores = None
+        for term in terms:
+            # Best score each document gets for this term.
+            termScores = {}
+            for token, factor in self.expand(term):
+                for document, weight in self.postings[token].items():
+                    score = weight * factor
+                    if termScores.get(document, 0) < score:
+                        termScores[document] = score
+
+            if scores == None:
+                scores = termScores
+            else:
+                scores = dict((document, score + termScores[document])
+                    for document, score in scores.items() if document in termScores)
+
+            if len(scores) == 0:
+                return []
+
+        # Only the top few need to be put in order.
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], self.documents[item[0]][1]))
+        results = []
+        for document, score in ranked:
+            kind, label, url = self.documents[document]
+            results.append({ 'kind': kind, 'label': label, 'url': url, 'score': round(score, 3) })
+        return results
+
+def getIndex():
+    """The index for the current data generation, built on first use."""
+    return perGeneration('searchIndex', SearchIndex.build)
+
+def matchingCourses(query):
+    """Ids of the courses matching every term of a query, by prefix
+    of a word in their subject, catalog number or name."""
+    index = getIndex()
+    courseIds = None
+    for term in tokenize(re.sub(r'([A-Za-z])(\d)', r'\1 \2', query)):
+        termIds = index.matchingCourses(term)
+        courseIds = termIds if courseIds == None else courseIds & termIds
+    return courseIds or set()
+
+def search(query, limit=20):
+    """Ranked courses and instructors matching a query."""
+    return getIndex().search(query, limit)
@@ -0,0 +1,95 @@
+"""Precomputed aggregates that pages read instead of adding up
+classes on every view. The scraper refreshes them as it loads,
+and takes a new site-wide snapshot once it's done."""
+
+from catalog.models import *
+from django.db.models import Exists, OuterRef, Sum
+from django.utils import timezone
+
+# CourseTermStats fields that pages and the API show.
+STATS_FIELDS = ['totalEnrollment', 'maxEnrollment', 'sectionCount', 'averageSize']
+
+def sectionType(sectionName):
+    """i.e. 'LEC 001' -> 'LEC'"""
+    return sectionName.split(' ', 1)[0]
+
+def refreshCourseTermStats(termCode, courseIds=None):
+    """Recomputes the CourseTermStats rows for some courses in a term,
+    or for every course offered in the term if courseIds is None.
+    Meant to be called in the same transaction that changed the classes."""
+    # A class counts as cancelled if any of its locations is.
+    cancelled = ClassLocation.objects.filter(classOffering=OuterRef('pk'), isCancelled=True)
+
+    classes = ClassOffering.objects.filter(courseOffering__term_id=termCode)
+    existing = CourseTermStats.objects.filter(term_id=termCode)
+    if courseIds != None:
+        classes = classes.filter(courseOffering__course_id__in=courseIds)
+        existing = existing.filter(course_id__in=courseIds)
+
+    # (Course id, section type) -> CourseTermStats
+    stats = {}
+    for courseId, sectionName, total, capacity, isCancelled in (classes
+            .annotate(isCancelled=Exists(cancelled))
+            .values_list('courseOffering__course_id', 'sectionName', 'enrollmentTotal', 'enrollmentCapacity', 'isCancelled')):
+        key = (courseId, sectionType(sectionName))
+
+        # Section types with only cancelled sections still get a row,
+        # so the course page still shows a column for them.
+        if key not in stats:
+            stats[key] = CourseTermStats(course_id=courseId, term_id=termCode, sectionType=key[1])
+
+        if not isCancelled:
+            stats[key].totalEnrollment += total
+            stats[key].maxEnrollment += capacity
+            stats[key].sectionCount += 1
+
+    for row in stats.values():
+        row.averageSize = int(row.totalEnrollment / row.sectionCount) if row.sectionCount > 0 else None
+
+    existing.delete()
+    CourseTermStats.objects.bulk_create(stats.values())
+    return len(stats)
+
+def refreshSiteStats():
+    """Takes a new snapshot of the site-wide numbers. Meant to be
+    called once a scrape is done, right before the generation is bumped."""
+    stats = SiteStats.objects.first() or SiteStats()
+
+    stats.subjectCount = Subject.objects.count()
+    stats.courseCount = Course.objects.count()
+    stats.instructorCount = Instructor.objects.count()
+    stats.termCount = Term.objects.count()
+    stats.courseOfferingCount = CourseOffering.objects.count()
+    stats.classCount = ClassOffering.objects.count()
+    stats.totalEnrollment = CourseTermStats.objects.aggregate(total=Sum('totalEnrollment'))['total'] or 0
+
+    termCodes = Term.objects.order_by('code').values_list('code', flat=True)
+    stats.firstTerm_id = termCodes.first()
+    stats.lastTerm_id = termCodes.last()
+
+    largest = CourseTermStats.objects.order_by('-totalEnrollment', 'term_id').first()
+    stats.largestCourse_id = largest.course_id if largest != None else None
+    stats.largestTerm_id = largest.term_id if largest != None else None
+    stats.largestSectionType = largest.sectionType if largest != None else ''
+    stats.largestEnrollment = largest.totalEnrollment if largest != None else 0
+
+    stats.updated = timezone.now()
+    stats.save()
+    return stats
+
+def enrollmentByTerm(course):
+    """Enrollment of a course in each term from the first to the last one
+    it was offered in, oldest first, as (Term, offered, { section type ->
+    STATS_FIELDS of its CourseTermStats row }). Terms it wasn't offered
+    in have no section types. Read by the course chart and the API."""
+    offeredTerms = set(CourseOffering.objects.filter(course=course).values_list('term_id', flat=True))
+    if len(offeredTerms) == 0:
+        return []
+
+    # Term code -> { section type -> stats }
+    sections = {}
+    for stats in CourseTermStats.objects.filter(course=course).values('term_id', 'sectionType', *STATS_FIELDS):
+        sections.setdefault(stats.pop('term_id'), {})[stats.pop('sectionType')] = stats
+
+    return [(term, term.code in offeredTerms, sections.get(term.code, {})) for term in Term.objects
+        .filter(code__gte=min(offeredTerms), code__lte=max(offeredTerms)).order_by('code')]
@@ -0,0 +1,41 @@
+"""Helpers for reading and sending large results a piece at a time,
+so memory use stays flat no matter how big the result is."""
+
+import json
+
+def keysetChunks(queryset, fields, size=2000):
+    """Yields value tuples of the given fields for every row of a queryset,
+    reading `size` rows per query. Rows are read in primary key order, each
+    query starting after the last key seen, so it works the same on every
+    database and never needs an OFFSET or a cursor held open between chunks.
+    The first field must be the primary key."""
+    queryset = queryset.order_by('pk')
+    last = None
+    while True:
+        chunk = queryset if last == None else queryset.filter(pk__gt=last)
+        rows = list(chunk.values_list(*fields)[:size])
+        if len(rows) == 0:
+            return
+
+        yield from rows
+        last = rows[-1][0]
+
+def streamJsonList(prefix, items, suffix, bufferSize=8192):
+    """Yields the text of a JSON document made of prefix, then every item
+    of an iterable as a comma separated JSON list, then suffix. Output is
+    grouped into pieces of about bufferSize characters."""
+    buffer = [prefix]
+    length = len(prefix)
+    separator = ''
+    for item in items:
+        text = separator + json.dumps(item)
+        separator = ','
+        buffer.append(text)
+        length += len(text)
+        if length >= bufferSize:
+            yield ''.join(buffer)
+            buffer = []
+            length = 0
+
+    buffer.append(suffix)
+    yield ''.join(buffer)
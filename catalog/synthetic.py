@@ -0,0 +1,172 @@
+"""Made-up catalog data for benchmarking.
+
+Generates terms, subjects and pages of classes shaped like the ones
+parseScheduleOfClasses returns, so they can be written with the same
+ClassLoader the scrapers use. Everything comes from one random seed,
+so the same options always give the same catalog."""
+
+from catalog.models import *
+
+import random
+
+# Parts that names are made from.
+SYLLABLES = ['an', 'bel', 'cor', 'da', 'el', 'fin', 'gar', 'hal', 'is', 'jen',
+    'kal', 'lor', 'mar', 'nor', 'os', 'per', 'quin', 'ros', 'sal', 'tor', 'ul', 'van', 'wen', 'yor', 'zel']
+TITLE_WORDS = ['Introduction', 'Advanced', 'Topics', 'Theory', 'Methods', 'Systems', 'Design',
+    'Analysis', 'Applied', 'Foundations', 'Principles', 'Modelling', 'Computation', 'Practice',
+    'Data', 'Networks', 'Algebra', 'Structures', 'Signals', 'Materials', 'History', 'Ethics']
+TERM_SEASONS = [('1', 'Winter'), ('5', 'Spring'), ('9', 'Fall')]
+SECTION_TYPES = ['LEC', 'TUT', 'LAB', 'TST']
+BUILDINGS = ['MC', 'DC', 'RCH', 'PHY', 'E7', 'STC', 'AL', 'HH', 'QNC', 'EIT']
+WEEKDAYS = ['MWF', 'TTh', 'MW', 'Th', 'F']
+
+# Column headings of a course's table of classes on salook.pl.
+CLASS_HEADINGS = ['Class', 'Comp Sec', 'Camp Loc', 'Assoc. Class', 'Rel 1', 'Rel 2', 'Enrl Cap', 'Enrl Tot',
+    'Wait Cap', 'Wait Tot', 'Time Days/Date', 'Bldg Room', 'Instructor']
+
+def term(year, month):
+    """(code, name) of a UWaterloo term, i.e. (2020, '9') -> ('1209', 'Fall 2020')"""
+    season = dict(TERM_SEASONS)[month]
+    return (str(year // 100 - 19) + str(year % 100).zfill(2) + month, season + ' ' + str(year))
+
+def terms(years, lastYear=2020):
+    """(code, name) of every term in the `years` years up to lastYear, oldest first."""
+    return [term(year, month) for year in range(lastYear - years + 1, lastYear + 1) for month, season in TERM_SEASONS]
+
+def word(rng, syllables):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(syllables))
+
+class SyntheticCatalog:
+    """A catalog of the given size. Subjects, courses and instructors
+    are fixed up front; which courses run in a term, and their
+    sections, are worked out from the seed one term at a time."""
+
+    def __init__(self, years=30, subjects=100, courses=50, offered=0.4, sections=3, instructors=4000, seed=0):
+        rng = random.Random(seed)
+        self.seed = seed
+        self.offered = offered
+        self.sections = sections
+
+        self.terms = terms(years)
+
+        # Subject codes of 2 to 4 letters, all different.
+        self.subjects = []
+        codes = set()
+        while len(self.subjects) < subjects:
+            code = ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(rng.randint(2, 4)))
+            if code not in codes:
+                codes.add(code)
+                self.subjects.append((code, word(rng, 3).capitalize() + ' Studies'))
+
+        # Subject code -> [(catalog number, title)], numbered like 100 to 799.
+        self.courses = {}
+        for code, name in self.subjects:
+            numbers = sorted(rng.sample(range(100, 800), min(courses, 700)))
+            self.courses[code] = [(str(number) + ('E' if rng.random() < 0.02 else ''),
+                ' '.join(rng.sample(TITLE_WORDS, 3))) for number in numbers]
+
+        # 'Last,First' the way the schedule writes instructors.
+        self.instructors = sorted(set(word(rng, 2).capitalize() + ',' + word(rng, 2).capitalize()
+            for _ in range(instructors)))
+
+    def courseCount(self):
+        return sum(len(courses) for courses in self.courses.values())
+
+    def page(self, termCode, subject):
+        """Parsed classes of one subject in one term, as parseScheduleOfClasses gives them."""
+        rng = random.Random(str(self.seed) + termCode + subject)
+        classes = []
+        classNum = 1000
+        for number, title in self.courses[subject]:
+            if rng.random() >= self.offered:
+                continue
+
+            # About `sections` lectures, and now and then a tutorial, lab or test.
+            sectionCounts = [('LEC', rng.randint(1, max(1, self.sections * 2 - 1)))]
+            for sectionType in SECTION_TYPES[1:]:
+                if rng.random() < 0.3:
+                    sectionCounts.append((sectionType, rng.randint(1, 2)))
+
+            for sectionType, count in sectionCounts:
+                for section in range(count):
+                    classNum += 1
+                    capacity = rng.choice([30, 60, 90, 120, 200, 300])
+                    building = rng.choice(BUILDINGS)
+                    cancelled = rng.random() < 0.03
+                    classes.append({
+                        "subject": subject,
+                        "catalog_number": number,
+                        "units": "0.50",
+                        "title": title,
+                        "note": None,
+                        "class_number": str(classNum),
+                        "section": sectionType + ' ' + str(section + 1).zfill(3),
+                        "campus": "UW U",
+                        "associated_class": str(section + 1),
+                        "related_component_1": None,
+                        "related_component_2": None,
+                        "enrollment_capacity": str(capacity),
+                        "enrollment_total": str(0 if cancelled else rng.randint(capacity // 3, capacity + 5)),
+                        "waiting_capacity": "0",
+                        "waiting_total": "0",
+                        "topic": None,
+                        "reserves": [],
+                        "classes": [{
+                            "date": {
+                                "start_time": None,
+                                "end_time": None,
+                                "weekdays": rng.choice(WEEKDAYS),
+                                "start_date": None,
+                                "end_date": None,
+                                "is_tba": False,
+                                "is_cancelled": cancelled,
+                                "is_closed": False,
+                            },
+                            "location": {
+                                "building": building,
+                                "room": str(rng.randint(1000, 4999)),
+                            },
+                            "instructors": [rng.choice(self.instructors)] if sectionType == 'LEC' else [],
+                        }],
+                        "held_with": [],
+                        "term": termCode,
+                        "academic_level": 'undergraduate' if int(number[:3]) < 600 else 'graduate',
+                        "last_updated": "",
+                    })
+        return classes
+
+    def html(self, classes):
+        """Renders a page of classes back into a schedule of classes page
+        laid out like salook.pl's, UTF-8 encoded with no declared charset,
+        for timing the parser. Leaves out reserves, topics and notes."""
+        out = ['<html><head><title>Schedule of Classes</title></head><body>\n',
+            '<p><i>This page was last updated on Thu Nov  5 10:03:29 EST 2020</i></p>\n<table border=2>\n']
+
+        # Classes of each course, in page order.
+        courses = {}
+        for c in classes:
+            courses.setdefault((c['subject'], c['catalog_number'], c['units'], c['title']), []).append(c)
+
+        for (subject, number, units, title), courseClasses in courses.items():
+            out.append('<tr><th>Subject</th><th>Catalog #</th><th>Units</th><th>Title</th></tr>\n')
+            out.append('<tr><td align=center>' + subject + ' </td><td align=center>' + number + ' </td><td align=center>'
+                + units + ' </td><td>' + title + '</td></tr>\n')
+            out.append('<tr><td colspan=4><table border=2>\n<tr>' + ''.join('<th>' + heading + '</th>' for heading in CLASS_HEADINGS) + '</tr>\n')
+            for c in courseClasses:
+                meeting = c['classes'][0]
+                location = meeting['location']
+                cells = [c['class_number'], c['section'], c['campus'], c['associated_class'],
+                    c['related_component_1'], c['related_component_2'],
+                    c['enrollment_capacity'], c['enrollment_total'], c['waiting_capacity'], c['waiting_total'],
+                    'Cancelled Section' if meeting['date']['is_cancelled'] else meeting['date']['weekdays'],
+                    location['building'] + ' ' + location['room']]
+                out.append('<tr>' + ''.join('<td align=center>' + (cell or '') + ' </td>' for cell in cells)
+                    + '<td>' + ''.join(meeting['instructors']) + ' </td></tr>\n')
+            out.append('</table></td></tr>\n<tr><td colspan=4></td></tr>\n')
+
+        out.append('</table>\n</body></html>\n')
+        return ''.join(out).encode('utf-8')
+
+    def createTermsAndSubjects(self):
+        Term.objects.bulk_create([Term(code=code, name=name) for code, name in self.terms], ignore_conflicts=True)
+        Subject.objects.bulk_create([Subject(code=code, name=name) for code, name in self.subjects], ignore_conflicts=True)
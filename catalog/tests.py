@@ -1,3 +1,195 @@
-from django.test import TestCase
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from catalog.classparser import BACKENDS, parseScheduleOfClasses
+from catalog.generation import cacheByGeneration, etag, readGeneration
+from catalog.loader import ClassLoader
+from catalog.models import ClassOffering, EnrollmentSnapshot, Subject, Term
+from catalog.pipeline import Pipeline
+from catalog.search import tokenize
+from pathlib import Path
+from unittest import skipUnless
 
-# Create your tests here.
+import contextlib
+import io
+
+# Saved schedule of classes pages, named like 1209_CS_undergraduate.html
+SALOOK_PAGES = Path(__file__).resolve().parent / 'testdata' / 'salook'
+
+def parsePage(name, backend):
+    """Parses one of the saved pages with the given backend."""
+    termCode, subject, academicLevel = name.split('_')
+    content = (SALOOK_PAGES / (name + '.html')).read_bytes()
+
+    # The parser prints about empty pages; keep that quiet.
+    with contextlib.redirect_stdout(io.StringIO()):
+        return parseScheduleOfClasses(content, termCode, subject, academicLevel, backend=backend)
+
+class ScheduleOfClassesParserTests(SimpleTestCase):
+    """Parses the saved pages, which between them have notes, reserves,
+    topics, held with, cancelled, closed and TBA sections, extra
+    instructor rows and the last updated marker."""
+
+    def classesByNumber(self, name, backend='soup'):
+        return dict((c['class_number'], c) for c in parsePage(name, backend))
+
+    @skipUnless('lxml' in BACKENDS, "lxml isn't installed")
+    def test_backends_agree(self):
+        for path in sorted(SALOOK_PAGES.glob('*.html')):
+            with self.subTest(page=path.stem):
+                self.assertEqual(parsePage(path.stem, 'soup'), parsePage(path.stem, 'lxml'))
+
+    def test_notes_and_reserves(self):
+        classes = self.classesByNumber('1209_CS_undergraduate')
+
+        self.assertEqual(classes['4702']['note'], "Choose TUT section for Related 1.")
+        self.assertEqual(classes['4702']['reserves'], [
+            { 'reserve_group': 'Math students', 'enrollment_capacity': '150', 'enrollment_total': '149' },
+            { 'reserve_group': 'Software Engineering students', 'enrollment_capacity': '30', 'enrollment_total': '27' },
+        ])
+        self.assertEqual(classes['4703']['reserves'], [])
+        self.assertEqual(classes['6113']['note'], None)
+
+    def test_cancelled_closed_and_tba_sections(self):
+        classes = self.classesByNumber('1209_CS_undergraduate')
+
+        cancelled = classes['4704']['classes'][0]['date']
+        self.assertTrue(cancelled['is_cancelled'])
+        self.assertFalse(cancelled['is_closed'])
+        self.assertEqual(classes['4704']['enrollment_total'], '0')
+
+        self.assertTrue(classes['6113']['classes'][0]['date']['is_closed'])
+
+        tba = classes['4705']['classes'][0]['date']
+        self.assertTrue(tba['is_tba'])
+        self.assertEqual(tba['weekdays'], None)
+
+    def test_instructors_topics_and_held_with(self):
+        classes = self.classesByNumber('1209_CS_undergraduate')
+
+        self.assertEqual(classes['4703']['classes'][0]['instructors'], ['Müller,José'])
+        self.assertEqual(classes['6113']['topic'], "Privacy and Surveillance")
+        self.assertEqual(classes['6113']['held_with'], ['CS 692'])
+        self.assertEqual(classes['6113']['classes'][0]['location'], { 'building': 'DC', 'room': '1350' })
+
+    def test_last_updated(self):
+        for c in parsePage('1209_CS_undergraduate', 'soup') + parsePage('1209_CS_graduate', 'soup'):
+            self.assertEqual(c['last_updated'], "on Thu Nov  5 10:03:29 EST 2020")
+
+    def test_graduate_headings(self):
+        classes = self.classesByNumber('1209_CS_graduate')
+
+        self.assertEqual(list(classes), ['6114'])
+        self.assertEqual(classes['6114']['academic_level'], 'graduate')
+        self.assertEqual(classes['6114']['held_with'], ['CS 492'])
+        self.assertEqual(len(classes['6114']['reserves']), 1)
+
+    def test_no_matches(self):
+        self.assertEqual(parsePage('1209_XYZ_undergraduate', 'soup'), [])
+
+class ClassLoaderTests(TestCase):
+    """Loads a saved page, then loads it again as later scrapes would."""
+
+    def setUp(self):
+        Term.objects.create(code='1209', name='Fall 2020')
+        Subject.objects.create(code='CS', name='Computer Science')
+        self.classes = parsePage('1209_CS_undergraduate', 'soup')
+        self.loader = ClassLoader()
+
+    def load(self, classes):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.loader.loadPage(classes, '1209')
+
+    def test_new_classes(self):
+        self.assertEqual(self.load(self.classes), len(self.classes))
+        self.assertEqual(self.loader.counts['new'], len(self.classes))
+        self.assertEqual(self.loader.counts['updated'], 0)
+        self.assertEqual(ClassOffering.objects.count(), len(self.classes))
+        self.assertEqual(self.loader.counts['snapshots'], EnrollmentSnapshot.objects.count())
+
+    def test_unchanged_page(self):
+        self.load(self.classes)
+        snapshots = EnrollmentSnapshot.objects.count()
+
+        self.assertEqual(self.load(parsePage('1209_CS_undergraduate', 'soup')), 0)
+        self.assertEqual(self.loader.counts['unchanged'], len(self.classes))
+        self.assertEqual(self.loader.counts['updated'], 0)
+        self.assertEqual(EnrollmentSnapshot.objects.count(), snapshots)
+
+    def test_updated_enrollment(self):
+        self.load(self.classes)
+        snapshots = EnrollmentSnapshot.objects.count()
+
+        classes = parsePage('1209_CS_undergraduate', 'soup')
+        changed = next(c for c in classes if c['class_number'] == '4702')
+        changed['enrollment_total'] = '150'
+
+        self.assertEqual(self.load(classes), 1)
+        self.assertEqual(self.loader.counts['updated'], 1)
+        self.assertEqual(self.loader.counts['unchanged'], len(classes) - 1)
+        self.assertEqual(EnrollmentSnapshot.objects.count(), snapshots + 1)
+        self.assertEqual(ClassOffering.objects.get(classNum='4702').enrollmentTotal, 150)
+
+class CacheByGenerationTests(TestCase):
+
+    def setUp(self):
+        self.calls = 0
+
+        @cacheByGeneration
+        def view(request):
+            self.calls += 1
+            return HttpResponse("page")
+
+        self.view = view
+
+    def test_matching_etag_is_not_modified(self):
+        tag = etag(readGeneration()[0])
+        response = self.view(RequestFactory().get('/', HTTP_IF_NONE_MATCH=tag))
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], tag)
+        self.assertEqual(self.calls, 0)
+
+    def test_other_etag_renders(self):
+        response = self.view(RequestFactory().get('/', HTTP_IF_NONE_MATCH='"stale-0"'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], etag(readGeneration()[0]))
+
+class PipelineTests(SimpleTestCase):
+
+    def test_failed_tasks_are_recorded(self):
+        def fetch(n):
+            if n == 2:
+                raise ValueError("no page")
+            return n * 10
+
+        loaded = []
+        def load(args, result):
+            if result == 30:
+                raise KeyError(result)
+            loaded.append(result)
+
+        pipeline = Pipeline(2)
+        pipeline.submitAll('pages', fetch, [(n,) for n in range(5)], load)
+        pipeline.submit('other', lambda: 'done', (), lambda args, result: loaded.append(result))
+        # The pipeline prints failures as they happen.
+        with contextlib.redirect_stdout(io.StringIO()):
+            pipeline.run()
+
+        failures = sorted(pipeline.failures, key=lambda f: f['args'])
+
+        self.assertEqual(sorted(loaded, key=str), [0, 10, 40, 'done'])
+        self.assertEqual([(f['stage'], f['args'], f['error']) for f in failures], [
+            ('pages', ['2'], "ValueError('no page')"),
+            ('pages', ['3'], 'KeyError(30)'),
+        ])
+        self.assertIn('ValueError', failures[0]['traceback'])
+        self.assertEqual(pipeline.report()['pages']['failed'], 2)
+        self.assertEqual(pipeline.report()['other']['failed'], 0)
+
+class TokenizeTests(SimpleTestCase):
+
+    def test_accented_names_stay_whole(self):
+        self.assertEqual(tokenize('Müller,José'), ['muller', 'jose'])
+        self.assertEqual(tokenize('Ørsted'), ['ørsted'])
+        self.assertEqual(tokenize('CS241E Algebra'), ['cs', '241e', 'algebra'])
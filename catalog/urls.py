@@ -1,15 +1,24 @@
 from django.urls import path
-from . import views
+from . import api, metrics, views
 
 urlpatterns = [
     path('', views.homepage, name='homepage'),
     path('about/', views.aboutpage, name='aboutpage'),
+    path('stats/', views.statspage, name='statspage'),
+    path('typeahead/', views.typeahead, name='typeahead'),
+    path('search/', views.search, name='search'),
     path('subjects/', views.subjects, name='subjects'),
     path('courses/', views.courses, name='courses'),
     path('courses/random/', views.courseRandom, name='courseRandom'),
     path('courses/<slug:subject>/', views.subjectDetail, name='subjectDetail'),
     path('courses/<slug:subject>/<slug:code>/', views.courseDetail, name='courseDetail'),
+    path('courses/<slug:subject>/<slug:code>/chart.json', views.courseChart, name='courseChart'),
     path('instructors/', views.InstructorListView.as_view(), name='instructors'),
     path('instructors/random/', views.instructorRandom, name='instructorRandom'),
     path('instructors/<int:instructorId>/', views.instructorDetail, name='instructorDetail'),
+    path('api/courses/<slug:subject>/<slug:code>/enrollment', api.courseEnrollment, name='apiCourseEnrollment'),
+    path('api/terms/<slug:termCode>/enrollment', api.termEnrollment, name='apiTermEnrollment'),
+    path('api/terms/<slug:termCode>/classes', api.termClasses, name='apiTermClasses'),
+    path('api/instructors/<int:instructorId>/classes', api.instructorClasses, name='apiInstructorClasses'),
+    path('metrics', metrics.metricsView, name='metrics'),
 ]
@@ -1,59 +1,184 @@
+from django.conf import settings
+from django.db.models import Q
+from django.http import JsonResponse
 from django.shortcuts import render, redirect
+from django.utils.decorators import method_decorator
 from django.views import generic
 from catalog.models import *
+from catalog.generation import cacheByGeneration, perGeneration
+from catalog.search import matchingCourses, search as searchCatalog
+from catalog.stats import enrollmentByTerm
 from django.db import connection, transaction
-import json
-
+from django.urls import reverse
+from array import array
+from urllib.parse import urlencode
+import random
+
+def siteStats():
+    """The snapshot taken after the last scrape, kept in memory until the
+    next one. Zeroes if nothing has been scraped yet."""
+    return perGeneration('siteStats', lambda: SiteStats.objects
+        .select_related('firstTerm', 'lastTerm', 'largestCourse__subject', 'largestTerm').first() or SiteStats())
+
+@cacheByGeneration
 def homepage(request):
     """View function for homepage."""
 
-    # Generate some counts to display
-    
-    numSubjects = Subject.objects.all().count()
-    numCourses = Course.objects.all().count()
-    numInstructors = Instructor.objects.all().count()
+    # Counts to display, from the last scrape
+    stats = siteStats()
 
     context = {
-        'num_subjects': numSubjects,
-        'num_courses': numCourses,
-        'num_instructors': numInstructors,
+        'num_subjects': stats.subjectCount,
+        'num_courses': stats.courseCount,
+        'num_instructors': stats.instructorCount,
     }
     
     return render(request, 'homepage.html', context=context)
 
+@cacheByGeneration
+def statspage(request):
+    """View function for site stats page."""
+    context = {
+        'stats': siteStats(),
+    }
+    return render(request, 'statspage.html', context=context)
+
+@cacheByGeneration
 def aboutpage(request):
     """View function for about page."""
     context = {}
     return render(request, 'aboutpage.html', context=context)
 
+def filterCourses(courseQS, query):
+    """Courses matching every term of a search, i.e. 'CS241 alg', by
+    prefix of a word in their subject, catalog number or name. Terms are
+    looked up in the search index, so the database only gets course ids."""
+    if query.strip() == '':
+        return courseQS
+    return courseQS.filter(id__in=matchingCourses(query))
+
+def filterInstructors(instructorQS, query):
+    """Instructors matching every term of a search by first or last name."""
+    for term in query.split():
+        instructorQS = instructorQS.filter(Q(firstName__istartswith=term) | Q(lastName__istartswith=term))
+    return instructorQS
+
+def nextPageQuery(query, **after):
+    """Query string for the page after this one."""
+    params = dict(after)
+    if query != '':
+        params['q'] = query
+    return urlencode(params)
+
+@cacheByGeneration
 def courses(request):
-    """View function for course list"""
+    """View function for course list. Filtered by ?q= and paged
+    by (subject, code), so each request only loads one page."""
+    
+    query = request.GET.get('q', '').strip()
+    courseQS = filterCourses(Course.objects.all(), query)
+    
+    # Keyset pagination: carry on after the last course
+    # of the previous page, which uses the unique index.
+    afterSubject = request.GET.get('afterSubject')
+    afterCode = request.GET.get('afterCode')
+    if afterSubject != None and afterCode != None:
+        courseQS = courseQS.filter(Q(subject_id__gt=afterSubject) | Q(subject_id=afterSubject, code__gt=afterCode))
     
     # select_related reduces number of queries to just one,
-    # doing a join on subject field.
-    courseList = list(Course.objects.all().select_related("subject"))
+    # doing a join on subject field. One extra row tells
+    # us whether there's another page.
+    courseList = list(courseQS.select_related("subject").order_by('subject_id', 'code')[:settings.LIST_PAGE_SIZE + 1])
+    
+    nextPage = None
+    if len(courseList) > settings.LIST_PAGE_SIZE:
+        courseList = courseList[:settings.LIST_PAGE_SIZE]
+        nextPage = nextPageQuery(query, afterSubject=courseList[-1].subject_id, afterCode=courseList[-1].code)
     
     context = {
        'course_list': courseList,
+       'query': query,
+       'next_page': nextPage,
+       'is_first_page': afterSubject == None,
     }
     
     return render(request, 'catalog/course_list.html', context=context)
 
+@cacheByGeneration
+def typeahead(request):
+    """Returns the first few courses and instructors matching ?q= as JSON,
+    for suggestions as you type in the course and instructor lists."""
+    
+    query = request.GET.get('q', '').strip()
+    if query == '':
+        return JsonResponse({'courses': [], 'instructors': []})
+    
+    courseList = (filterCourses(Course.objects.all(), query)
+        .select_related('subject').order_by('subject_id', 'code')[:settings.TYPEAHEAD_SIZE])
+    instructorList = (filterInstructors(Instructor.objects.all(), query)
+        .order_by('firstName', 'lastName')[:settings.TYPEAHEAD_SIZE])
+    
+    return JsonResponse({
+        'courses': [{
+            'label': str(course) + ' - ' + str(course.name),
+            'url': course.getAbsoluteUrl(),
+        } for course in courseList],
+        'instructors': [{
+            'label': str(instructor),
+            'url': instructor.getAbsoluteUrl(),
+        } for instructor in instructorList],
+    })
+
+@cacheByGeneration
+def search(request):
+    """Returns courses and instructors matching ?q= as JSON, best match first."""
+    
+    query = request.GET.get('q', '').strip()
+    
+    return JsonResponse({
+        'query': query,
+        'results': searchCatalog(query, settings.SEARCH_SIZE),
+    })
+
+def courseKeys(subjectCode=None, termCode=None):
+    """(subject, code) of every course, or of the courses in a subject
+    or offered in a term. Kept in memory until the next scrape."""
+    def build():
+        courseQS = Course.objects.all()
+        if subjectCode != None:
+            courseQS = courseQS.filter(subject_id=subjectCode)
+        if termCode != None:
+            courseQS = courseQS.filter(courseoffering__term_id=termCode)
+        return list(courseQS.order_by('subject_id', 'code').values_list('subject_id', 'code'))
+    
+    return perGeneration(('courseKeys', subjectCode, termCode), build)
+
 def courseRandom(request):
-    """Redirects to a random course's page. 
+    """Redirects to a random course's page. Can be narrowed
+       down to a subject with ?subject= or a term with ?term=.
        TODO make an error page if there are no courses.
     """
     
-    count = Course.objects.count()
+    subjectCode = request.GET.get('subject', '').upper() or None
+    termCode = request.GET.get('term') or None
+    
+    # Only keep lists for subjects and terms that exist.
+    codes = perGeneration('codes', lambda: (
+        set(Subject.objects.values_list('code', flat=True)),
+        set(Term.objects.values_list('code', flat=True))))
+    if (subjectCode != None and subjectCode not in codes[0]) or (termCode != None and termCode not in codes[1]):
+        return redirect('homepage')
+    
+    keys = courseKeys(subjectCode, termCode)
 
-    if count == 0:
+    if len(keys) == 0:
         # No courses, just redirect to home.
         return redirect('homepage')
     else:
-        from random import randint
-        model = Course.objects.all()[randint(0,count)] 
-        return redirect(model.getAbsoluteUrl())
+        subject, code = random.choice(keys)
+        return redirect(reverse('courses') + subject + '/' + code + '/')
 
+@cacheByGeneration
 def subjects(request):
     """View function for subject list"""
     
@@ -63,6 +188,7 @@ def subjects(request):
     }
     return render(request, 'catalog/subject_list.html', context=context)
 
+@cacheByGeneration
 def subjectDetail(request, subject):
     """View function for a subject (i.e. CS)"""
     
@@ -88,6 +214,7 @@ def subjectDetail(request, subject):
     
     return render(request, 'catalog/subject_detail.html', context=context)
 
+@cacheByGeneration
 def courseDetail(request, subject, code):
     """View function for a specific course (i.e. CS 241E)"""
     
@@ -117,17 +244,30 @@ def courseDetail(request, subject, code):
     context['course'] = courseModel
     context['course_exists'] = True
     
-    # Get course offerings for this term.
-    offeringQS = CourseOffering.objects.filter(course=courseModel).select_related('term')
+    # Get every offering of the course.
+    allOfferings = list(CourseOffering.objects.filter(course=courseModel).select_related('term'))
     
-    if offeringQS.exists() == False:
+    if len(allOfferings) == 0:
         # No offerings of this course are in db
         context['offering_exists'] = False
     else:
         context['offering_exists'] = True
 
-        terms = Term.objects.all().order_by('-code')
-        offerings = list(offeringQS)
+        # One row per term from the course's last offering back to its
+        # first, most recent first. Only the latest few are shown unless
+        # all are asked for, so the page stays small for long-running courses.
+        offeredCodes = set(offering.term_id for offering in allOfferings)
+        termQS = Term.objects.filter(code__gte=min(offeredCodes), code__lte=max(offeredCodes)).order_by('-code')
+        if request.GET.get('allTerms') != None:
+            terms = list(termQS)
+        else:
+            terms = list(termQS[:settings.COURSE_TERM_ROWS + 1])
+            if len(terms) > settings.COURSE_TERM_ROWS:
+                terms = terms[:settings.COURSE_TERM_ROWS]
+                context['all_terms_count'] = termQS.count()
+        
+        shownCodes = [term.code for term in terms]
+        offerings = [offering for offering in allOfferings if offering.term_id in shownCodes]
         
         data = {}
 
@@ -167,128 +307,103 @@ def courseDetail(request, subject, code):
                 'instructors': set(),
             }
         
-        # Find the first/last term the course 
-        # was offered
-        firstTermOffered = offerings[0].term
-        lastTermOffered = offerings[0].term
-        
         # Find which terms have course offering data
         for offering in offerings:
             data[offering.term]['hasData'] = True
             
-            if offering.term < firstTermOffered:
-                firstTermOffered = offering.term
-            if offering.term > lastTermOffered:
-                lastTermOffered = offering.term
-            
-
-        # Grab classLocations happening for this course
-        classLocations = list(ClassLocation.objects
-            .filter(classOffering__courseOffering__course__subject=subject,classOffering__courseOffering__course__code=code)
-            .prefetch_related('instructor')
-            .select_related('classOffering__courseOffering__term')
-            .order_by('classOffering__courseOffering__term'))
-            
-
-        # Get all the instructors
-        for classLocation in classLocations:
-            for instructor in list(classLocation.instructor.all()):
-                data[classLocation.classOffering.courseOffering.term]['instructors'].add(instructor)
 
+        # Term of each of the course's offerings, by id
+        offeringTerms = dict((offering.id, offering.term) for offering in offerings)
         
-        # Get class offerings
+        # Get class offerings, ordered so sections come out sorted
         classOfferingList = list(ClassOffering.objects
-            .filter(courseOffering__course__subject=subject,courseOffering__course__code=code)
-            .select_related('courseOffering__term')
-            .order_by('courseOffering__term'))
+            .filter(courseOffering__course=courseModel, courseOffering__term_id__in=shownCodes)
+            .order_by('sectionName'))
         
-
-        # Find the possible section types
-        # i.e. LEC, TUT, TST
-        sectionTypes = set()
+        # Index the course's classLocations by ClassOffering id, so
+        # each class can find its own without going through them all.
+        cancelledClasses = set()
+        classInstructors = {}
+        for classLocation in (ClassLocation.objects
+                .filter(classOffering__courseOffering__course=courseModel,
+                    classOffering__courseOffering__term_id__in=shownCodes)
+                .only('id', 'classOffering', 'isCancelled')
+                .prefetch_related('instructor')):
+            if classLocation.isCancelled:
+                cancelledClasses.add(classLocation.classOffering_id)
+            classInstructors.setdefault(classLocation.classOffering_id, set()).update(classLocation.instructor.all())
         
-
-        for classOffering in classOfferingList:
-            # i.e. LEC 001 -> LEC 
-            sectionType = classOffering.sectionName.split(' ', 1)[0]
-            sectionTypes.add(sectionType)
+        # Enrollment totals are precomputed by the scraper, one
+        # row per term and section type (i.e. LEC, TUT, TST).
+        termStats = list(CourseTermStats.objects.filter(course=courseModel, term_id__in=shownCodes))
+        
+        # Find the possible section types, in the order they're shown.
+        # Classes count too, in case the stats haven't been worked out yet.
+        sectionTypes = sorted(set(stats.sectionType for stats in termStats)
+            | set(classOffering.sectionName.partition(' ')[0] for classOffering in classOfferingList))
+        
+        def emptySection():
+            return {
+                'sections': [],
+                'sectionCount': 0,
+                'averageSize': 'n/a',
+                'totalEnrollment': 0,
+                'maxEnrollment': 0,
+            }
         
         # Set default values in data structure
         for term in terms:
             if data[term]['hasData'] == True:
                 for sectionType in sectionTypes:
-                    data[term]['enrollment'][sectionType] = {
-                        'sections': [],
-                        'sectionCount': 0,
-                        'averageSize': 0,
-                        'totalEnrollment': 0,
-                        'maxEnrollment': 0,
-                    }
+                    data[term]['enrollment'][sectionType] = emptySection()
         
-        # Returns true if a ClassOffering has any ClassLocation with isCancelled == true
-        def isCancelled(classOffering):
-            return False
-            for classLocation in classLocations:
-                if classLocation.classOffering == classOffering:
-                    if classLocation.isCancelled: 
-                        return True
-                
-            return False
+        termsByCode = dict((term.code, term) for term in terms)
+        for stats in termStats:
+            term = termsByCode[stats.term_id]
+            if data[term]['hasData'] == False:
+                continue
+            
+            data[term]['enrollment'].setdefault(stats.sectionType, emptySection()).update({
+                'sectionCount': stats.sectionCount,
+                'averageSize': stats.averageSize if stats.averageSize != None else 'n/a',
+                'totalEnrollment': stats.totalEnrollment,
+                'maxEnrollment': stats.maxEnrollment,
+            })
+            
+            # Offered if any section wasn't cancelled.
+            if stats.sectionCount > 0:
+                data[term]['isCancelled'] = False
         
-        # returns instructors associated with 
-        # class offering from class location
-        def getInstructors(classOffering):
-            instructors = set()
-            for classLocation in classLocations:
-                for instructor in list(classLocation.instructor.all()):
-                    instructors.add(instructor)
-            return instructors
-          
         for classOffering in classOfferingList:
-            sectionType = classOffering.sectionName.split(' ', 1)[0]
-            sectionNum = classOffering.sectionName.split(' ', 1)[1]
-            term = classOffering.courseOffering.term
+            sectionType, _, sectionNum = classOffering.sectionName.partition(' ')
+            term = offeringTerms[classOffering.courseOffering_id]
+            instructors = classInstructors.get(classOffering.id, set())
+            data[term]['instructors'].update(instructors)
+            sections = data[term]['enrollment'].setdefault(sectionType, emptySection())['sections']
             
-            if isCancelled(classOffering):
-                data[term]['enrollment'][sectionType]['sections'].append({
+            if classOffering.id in cancelledClasses:
+                sections.append({
                     'num': sectionNum,
                     'total': 0,
                     'max': 0,
                     'isCancelled': True,
-                    #'instructors': getInstructors(classOffering)
+                    'instructors': sorted(instructors),
                 })
             else:
-                # Both offering and class not cancelled
-                # Update default value
                 data[term]['isCancelled'] = False
-                
-                data[term]['enrollment'][sectionType]['totalEnrollment'] += classOffering.enrollmentTotal
-                
-
-                data[term]['enrollment'][sectionType]['maxEnrollment'] += classOffering.enrollmentCapacity
-                
-                data[term]['enrollment'][sectionType]['sectionCount'] += 1
-                
-                data[term]['enrollment'][sectionType]['sections'].append({
+                sections.append({
                     'num': sectionNum,
                     'total': classOffering.enrollmentTotal,
                     'max': classOffering.enrollmentCapacity,
                     'isCancelled': False,
-                    #'instructors': getInstructors(classOffering)
+                    'instructors': sorted(instructors),
                 })
 
 
         # Final data cleanup
         for term in terms:
-            # Calculate average section size for each section type in each term
-            for sectionName, sectionDict in data[term]['enrollment'].items():
-                sectionDict['averageSize'] = int(sectionDict['totalEnrollment'] / sectionDict['sectionCount']) if sectionDict['sectionCount'] > 0 else 'n/a'
-                
-                # Also sort sections
-                sectionDict['sections'] = sorted(sectionDict['sections'], key=lambda d: d['num'])
-            
-            # Sort enrollment dictionaries
-            data[term]['enrollment_items'] = sorted(data[term]['enrollment'].items())
+            # Sections and section types are already in order
+            data[term]['enrollment_items'] = list(data[term]['enrollment'].items())
             
             # Sort instructors by name
             data[term]['instructors'] = sorted(data[term]['instructors'])
@@ -304,64 +419,35 @@ def courseDetail(request, subject, code):
                 data[term]['firstInstructors'] =  data[term]['instructors']
         
         
-        # Create chart data
-        termDataItems = sorted(data.items(), reverse=True)
-        
-        chartData = {
-            'labels': [],
-            'datasets': [],
-        }
-        
-        
-        def getSectionTypeColour(sectionType, alpha=1):
-            d = {
-                'LEC': '102, 102, 255',
-                'TUT': '152, 205, 170',
-                
-            }
-            
-            return 'rgba(' + d.get(sectionType, "203, 230, 212") + "," + str(alpha) + ')'
-        
-        
-        # One dataset for each section type
-        sectionTypes = sorted(sectionTypes)
-        for sectionType in sectionTypes: 
-            chartData['datasets'].append({
-                'label': sectionType,
-                'data': [],
-				'backgroundColor': getSectionTypeColour(sectionType, 0.2),
-				'borderColor':getSectionTypeColour(sectionType, 1),
-				'borderWidth': 1,
-                'pointRadius': 3,
-                'spanGaps': False, # Useful for null data.
-            })
-        
-        # Reverse to loop through terms from least to most recent
-        for term, info in reversed(termDataItems):
-            if (term > firstTermOffered and term < lastTermOffered) or term == firstTermOffered or term == lastTermOffered:
-                chartData['labels'].append(term.reverseName())
-                
-                # sectionTypes will be looped through in same order.
-                for i in range(0, len(sectionTypes)):
-                    sectionType = sectionTypes[i]
-                    
-                    if info['hasData'] == True:
-                        chartData['datasets'][i]['data'].append(info['enrollment'][sectionType]['totalEnrollment'])
-                    else:
-                        chartData['datasets'][i]['data'].append(0)
-
-                
-        
-            
-            
-        
-        
-        context['term_data_items'] = termDataItems
-        context['section_types'] = sorted(sectionTypes)
-        context['chart_data'] = json.dumps(chartData)
+        # Terms were added most recent first. The chart's
+        # data is loaded separately, from courseChart.
+        context['term_data_items'] = list(data.items())
+        context['section_types'] = sectionTypes
 
     return render(request, 'catalog/course_detail.html', context=context)
 
+@cacheByGeneration
+def courseChart(request, subject, code):
+    """Chart data for a course page: total enrollment of each section type
+    in every term from the first to the last one the course was offered in,
+    as one list of numbers per section type. The page loads it once shown."""
+    
+    course = Course.objects.filter(subject_id=subject.upper(), code=code.upper()).first()
+    if course == None:
+        return JsonResponse({'error': "Course '" + subject + " " + code + "' not found."}, status=404)
+    
+    # Same terms and numbers as the API's course enrollment.
+    enrollment = enrollmentByTerm(course)
+    sectionTypes = sorted(set(sectionType for term, offered, sections in enrollment for sectionType in sections))
+    
+    labels = [term.reverseName() for term, offered, sections in enrollment]
+    series = [[sections[sectionType]['totalEnrollment'] if sectionType in sections else 0
+        for term, offered, sections in enrollment] for sectionType in sectionTypes]
+    
+    return JsonResponse({'labels': labels, 'types': sectionTypes, 'series': series},
+        json_dumps_params={'separators': (',', ':')})
+
+@cacheByGeneration
 def instructorDetail(request, instructorId):
     """View function for one instructor"""
     
@@ -399,22 +485,49 @@ def instructorRandom(request):
        TODO make an error page if there are no instructors.
     """
     
-    count = Instructor.objects.count()
+    # Ids of every instructor, kept in memory until the next scrape.
+    ids = perGeneration('instructorIds', lambda: array('i', Instructor.objects.values_list('id', flat=True)))
 
-    if count == 0:
+    if len(ids) == 0:
         # No instructors, just redirect to home.
         return redirect('homepage')
     else:
-        from random import randint
-        model = Instructor.objects.all()[randint(0,count)] 
-        return redirect(model.getAbsoluteUrl())
+        return redirect(reverse('instructors') + str(random.choice(ids)) + '/')
 
+@method_decorator(cacheByGeneration, name='dispatch')
 class InstructorListView(generic.ListView):
     """Generic view that will query database
-        automatically. to get data on courses and
-        display it."""
+        automatically. to get data on instructors and
+        display it. Filtered by ?q= and paged by 
+        (firstName, lastName)."""
         
     model = Instructor
-
-
+    template_name = 'catalog/instructor_list.html'
+    context_object_name = 'instructor_list'
+    
+    def get_queryset(self):
+        self.query = self.request.GET.get('q', '').strip()
+        instructorQS = filterInstructors(Instructor.objects.all(), self.query)
+        
+        # Keyset pagination, like the course list.
+        self.afterFirst = self.request.GET.get('afterFirst')
+        afterLast = self.request.GET.get('afterLast')
+        if self.afterFirst != None and afterLast != None:
+            instructorQS = instructorQS.filter(Q(firstName__gt=self.afterFirst) | Q(firstName=self.afterFirst, lastName__gt=afterLast))
+        
+        instructorList = list(instructorQS.order_by('firstName', 'lastName')[:settings.LIST_PAGE_SIZE + 1])
+        
+        self.nextPage = None
+        if len(instructorList) > settings.LIST_PAGE_SIZE:
+            instructorList = instructorList[:settings.LIST_PAGE_SIZE]
+            self.nextPage = nextPageQuery(self.query, afterFirst=instructorList[-1].firstName, afterLast=instructorList[-1].lastName)
+        
+        return instructorList
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.query
+        context['next_page'] = self.nextPage
+        context['is_first_page'] = self.afterFirst == None
+        return context
 
@@ -1,4 +1 @@
-python3 manage.py scrapeterms
-python3 manage.py scrapesubjects
-python3 manage.py scrapecourses
-python3 manage.py scrapeclasses
+python3 manage.py scrape
@@ -0,0 +1,80 @@
+// Draws the enrollment chart on a course page. The data is fetched
+// from the URL in the chart container's data-url once it's in view,
+// so the page itself stays small and can be cached on its own.
+
+// Chart colours by section type
+var sectionTypeColours = {
+	'LEC': '102, 102, 255',
+	'TUT': '152, 205, 170',
+}
+
+function getSectionTypeColour(sectionType, alpha) {
+	return 'rgba(' + (sectionTypeColours[sectionType] || '203, 230, 212') + ',' + alpha + ')'
+}
+
+// The data comes as { labels: [...], types: [...], series: [[...], ...] },
+// with one list of enrollment totals per section type.
+function drawChart(chart) {
+	var ctx = document.getElementById('myChart').getContext('2d');
+	var myChart = new Chart(ctx, {
+		type: 'line',
+		data: {
+			labels: chart.labels,
+			datasets: chart.types.map(function(sectionType, i) {
+				return {
+					label: sectionType,
+					data: chart.series[i],
+					backgroundColor: getSectionTypeColour(sectionType, 0.2),
+					borderColor: getSectionTypeColour(sectionType, 1),
+					borderWidth: 1,
+					pointRadius: 3,
+					spanGaps: false, // Useful for null data.
+				}
+			}),
+		},
+		options: {
+			scales: {
+				yAxes: [{
+					ticks: {
+						beginAtZero: true
+					}
+				}],
+				xAxes:[{
+					ticks: {
+						padding: 10
+					}
+				}],
+			},
+			title: {
+				display: true,
+				text: 'Enrollment'
+			},
+			tooltips: {
+					mode: 'index',
+					intersect: false,
+			},
+			maintainAspectRatio: false,
+		},
+	});
+}
+
+var chartContainer = document.querySelector('.chart_container')
+
+// Fetch the data once the chart scrolls into view.
+function loadChart() {
+	fetch(chartContainer.dataset.url)
+		.then(function(response) { return response.json() })
+		.then(drawChart)
+}
+
+if ('IntersectionObserver' in window) {
+	var chartObserver = new IntersectionObserver(function(entries) {
+		if (entries.some(function(entry) { return entry.isIntersecting })) {
+			chartObserver.disconnect()
+			loadChart()
+		}
+	})
+	chartObserver.observe(chartContainer)
+} else {
+	loadChart()
+}
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'catalog.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -126,6 +127,93 @@ USE_L10N = True
 USE_TZ = True
 
 
+# Where the scrapers keep raw copies of fetched pages,
+# so they can be parsed again without hitting the network.
+SCRAPE_CACHE_DIR = env('SCRAPE_CACHE_DIR', default=os.path.join(BASE_DIR, 'scrape_cache'))
+
+# Where `manage.py scrape` writes its JSON run reports.
+SCRAPE_REPORT_DIR = env('SCRAPE_REPORT_DIR', default=os.path.join(BASE_DIR, 'scrape_reports'))
+
+# Where `manage.py exportcatalog` writes its files by default.
+EXPORT_DIR = env('EXPORT_DIR', default=os.path.join(BASE_DIR, 'exports'))
+
+# How the scrapers' HTTP client deals with slow or failing servers.
+# Failed requests are retried with exponential backoff:
+# SCRAPE_HTTP_BACKOFF * 2^(attempt - 1) seconds between attempts.
+SCRAPE_HTTP_TIMEOUT = env.float('SCRAPE_HTTP_TIMEOUT', default=30)
+SCRAPE_HTTP_RETRIES = env.int('SCRAPE_HTTP_RETRIES', default=5)
+SCRAPE_HTTP_BACKOFF = env.float('SCRAPE_HTTP_BACKOFF', default=1)
+
+
+# Caches. Defaults to an in-process cache; set CACHE_URL to i.e.
+# filecache:///var/tmp/waterlook to share one cache between processes.
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Cache that rendered catalog pages are kept in. Entries are keyed
+# on the data generation, which the scrape commands bump, so they
+# never need to expire on their own.
+PAGE_CACHE = env('PAGE_CACHE', default='default')
+
+# Version of the code and templates, also part of cached pages' keys
+# and ETags, so pages rendered before a deploy aren't served after it.
+# Defaults to a hash of the catalog app's source and templates; set it
+# to i.e. the deployed commit to choose when pages are rerendered.
+PAGE_CACHE_VERSION = env('PAGE_CACHE_VERSION', default='')
+
+# How many seconds a web process may go before checking whether
+# a scrape has bumped the data generation.
+DATA_GENERATION_POLL = env.float('DATA_GENERATION_POLL', default=5)
+
+# Cached pages log the share of requests answered with a 304
+# or from the cache once every this many requests.
+PAGE_HIT_LOG_EVERY = env.int('PAGE_HIT_LOG_EVERY', default=1000)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'catalog': {
+            'handlers': ['console'],
+            'level': env('CATALOG_LOG_LEVEL', default='INFO'),
+        },
+    },
+}
+
+
+# Number of rows on each page of the course and instructor lists,
+# and number of suggestions of each kind given while typing.
+LIST_PAGE_SIZE = env.int('LIST_PAGE_SIZE', default=100)
+TYPEAHEAD_SIZE = env.int('TYPEAHEAD_SIZE', default=10)
+
+# Number of terms shown in a course page's table before
+# the rest are left behind a "show all terms" link.
+COURSE_TERM_ROWS = env.int('COURSE_TERM_ROWS', default=24)
+
+# Number of results /search/ gives back.
+SEARCH_SIZE = env.int('SEARCH_SIZE', default=20)
+
+# Share of requests (0 to 1) whose query count and timings are
+# recorded.
+METRICS_SAMPLE_RATE = env.float('METRICS_SAMPLE_RATE', default=0.1)
+
+# Who may read them at /metrics: a scraper sending
+# 'Authorization: Bearer <METRICS_TOKEN>', or one connecting straight
+# from one of METRICS_ALLOWED_IPS. Neither is set by default, so
+# /metrics is off until one is. Behind a reverse proxy every request
+# comes from the proxy's address (often 127.0.0.1), so don't list
+# that; use the token instead.
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', default=[])
+
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 